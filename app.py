@@ -12,28 +12,39 @@ import streamlit as st
 from rag_engine import RAGLogAnalyzer, AnalysisResult, BackendType, Contact, Solution
 import os
 import time
-import random
+import requests
 from dotenv import load_dotenv
 import re
-import io
 import html
 import json
+import hashlib
+import pickle
+import functools
+import itertools
+import logging
+import importlib.util
+from collections import Counter
+from types import MappingProxyType
 
-# PDF generation imports (optional)
+# Multi-keyword matcher for log highlighting (optional, falls back to regex)
 try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_LEFT, TA_CENTER
-    REPORTLAB_AVAILABLE = True
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Fast non-cryptographic hashing for cache keys (optional, falls back to blake2b)
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
 except ImportError:
-    REPORTLAB_AVAILABLE = False
+    XXHASH_AVAILABLE = False
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Page config
 st.set_page_config(
     page_title="LogGuard",
@@ -45,7 +56,7 @@ st.set_page_config(
 # ============================================================
 # PROFESSIONAL UI - COMPLETE OVERHAUL
 # ============================================================
-st.markdown("""
+_APP_CSS_SOURCE = """
 <style>
     /* ===== HIDE STREAMLIT UI ELEMENTS ===== */
     #MainMenu, footer, header {visibility: hidden;}
@@ -176,6 +187,62 @@ st.markdown("""
         color: var(--accent-danger);
     }
     
+    /* Control bar read-only panels */
+    .backend-badge {
+        padding: 0.5rem 1rem;
+        background: var(--bg-secondary);
+        border-radius: 8px;
+        border: 1px solid var(--border-subtle);
+    }
+    
+    .backend-badge .backend-name {
+        color: var(--accent-success);
+        font-weight: 500;
+    }
+    
+    .layer2-disabled {
+        text-align: center;
+        opacity: 0.5;
+        padding: 0.5rem;
+    }
+    
+    .layer2-disabled .layer2-label {
+        font-size: 0.75rem;
+        color: var(--text-muted);
+    }
+    
+    .layer2-disabled .layer2-reason {
+        font-size: 0.6875rem;
+        color: var(--accent-danger);
+    }
+    
+    .control-stats {
+        display: flex;
+        justify-content: space-around;
+        gap: 1rem;
+    }
+    
+    .kb-status {
+        text-align: center;
+    }
+    
+    .stat-label {
+        font-size: 0.75rem;
+        color: var(--text-muted);
+        text-transform: uppercase;
+        font-weight: 600;
+    }
+    
+    .stat-value {
+        font-size: 1.25rem;
+        font-weight: 700;
+        color: var(--text-primary);
+    }
+    
+    .stat-value.empty {
+        color: var(--text-muted);
+    }
+    
     /* ===== METRICS GRID ===== */
     .metrics-grid {
         display: grid;
@@ -700,17 +767,220 @@ st.markdown("""
     ::-webkit-scrollbar-thumb { background: var(--border-medium); border-radius: 3px; }
     ::-webkit-scrollbar-thumb:hover { background: var(--accent-primary); }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};,])\s*')
+_CSS_COLON_RE = re.compile(r':\s+')
+
+
+def _minify_css(css: str) -> str:
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = _CSS_SPACE_RE.sub(' ', css)
+    css = _CSS_PUNCT_RE.sub(r'\1', css)
+    css = _CSS_COLON_RE.sub(':', css)
+    return css.replace(';}', '}').strip()
+
+
+# Minified once at import; this is what every rerun ships to the browser
+_APP_CSS = _minify_css(_APP_CSS_SOURCE)
+
+
+# Line severity classification for highlight_errors. Ranks: 1 = error, 2 = warning, 3 = info.
+_SEVERITY_KEYWORDS = (
+    (1, ('error', 'critical', 'fail', 'exception', 'fatal', '错误')),
+    (2, ('warning', 'warn', '警告')),
+    (3, ('info', 'debug', 'trace')),
+)
+
+
+def _build_severity_automaton():
+    automaton = ahocorasick.Automaton()
+    for rank, words in _SEVERITY_KEYWORDS:
+        for word in words:
+            automaton.add_word(word, rank)
+    automaton.make_automaton()
+    return automaton
+
+
+_SEVERITY_AC = _build_severity_automaton() if AHOCORASICK_AVAILABLE else None
+
+# Regex fallback when pyahocorasick isn't installed. Each branch is a lookahead
+# so a single match() keeps the original priority: error > warning > info.
+_SEVERITY_RE = re.compile(
+    '|'.join(f"(?=.*?({'|'.join(words)}))" for _, words in _SEVERITY_KEYWORDS),
+    re.IGNORECASE
+)
+
+_LINE_RE = re.compile(r'^.*$', re.MULTILINE)
+
+# highlight_errors renders at most head + tail lines of very large logs
+_HIGHLIGHT_MAX_LINES = 5000
+_HIGHLIGHT_HEAD_LINES = 2000
+_HIGHLIGHT_TAIL_LINES = 2000
+_TRUNCATION_MARKER = '<span style="color: #64748b; font-style: italic;">... [truncated {count:,} lines] ...</span>'
+
+_HTML_UNSAFE_RE = re.compile(r'[<>&"\']')
+
+# Sanitized Log panel shows only this many trailing lines unless "Show full log" is on
+_SANITIZED_TAIL_LINES = 500
+
+# Sanitized Log panel. A <pre> HTML block only ends at </pre>, so blank log
+# lines can't drop the rest back into markdown; pre-wrap keeps the newlines
+_SANITIZED_LOG_TMPL = (
+    '<pre style="background: var(--bg-secondary); padding: 1rem; border-radius: 10px; '
+    'max-height: 400px; overflow-y: auto; font-family: \'JetBrains Mono\', monospace; '
+    'font-size: 0.8125rem; line-height: 1.6; border: 1px solid var(--border-subtle); '
+    'margin: 0; white-space: pre-wrap; word-break: break-word;">{body}</pre>'
+)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# Backend selector labels, in display order
+_BACKEND_CHOICES = {
+    "⚡ Groq API": BackendType.GROQ_API,
+    "☁️ Claude API": BackendType.CLAUDE_API,
+    "🏠 Local Ollama": BackendType.OLLAMA_LOCAL,
+}
+
+_SEVERITY_ICONS = {"CRITICAL": "🔴", "ERROR": "🟠", "WARNING": "🟡", "INFO": "🟢"}
+
+_SEVERITY_SPANS = {
+    1: '<span style="color: #ef4444; font-weight: 500;">{}</span>',
+    2: '<span style="color: #f59e0b; font-weight: 500;">{}</span>',
+    3: '<span style="color: #06b6d4;">{}</span>',
+    None: '<span style="color: #64748b;">{}</span>',
+}
 
 
 @st.cache_resource
-def load_analyzer(_backend_type: BackendType, enable_layer2: bool):
-    return RAGLogAnalyzer(backend=_backend_type, enable_layer2_sanitization=enable_layer2)
+def _loaded_cores() -> dict:
+    """Analyzers already built by _load_core, by backend value (process-wide, survives session resets)"""
+    return {}
 
 
-def render_metric_card(label, value, icon, severity_class=""):
-    """Render a metric card with icon"""
-    st.markdown(f"""
+@st.cache_resource
+def _load_core(backend_value: str):
+    # Keyed on the backend value only and shared by every session, so it is never mutated:
+    # the Layer 2 setting is passed to analyze()/analyze_multi() per call instead
+    analyzer = RAGLogAnalyzer(backend=BackendType(backend_value), enable_layer2_sanitization=False)
+    _loaded_cores()[backend_value] = analyzer
+    return analyzer
+
+
+def load_analyzer(backend_type: BackendType):
+    return _load_core(backend_type.value)
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def kb_doc_count(collection_id: int, _collection) -> int:
+    """Knowledge base size; keyed on the collection object so a reloaded analyzer re-counts"""
+    return _collection.count() if _collection else 0
+
+
+def loaded_kb_count(backend: BackendType):
+    """KB size from the backend's analyzer if it is already loaded, else None; never loads one"""
+    analyzer = _loaded_cores().get(backend.value)
+    return kb_doc_count(id(analyzer.collection), analyzer.collection) if analyzer else None
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def is_ollama_available():
+    try:
+        response = requests.get("http://localhost:11434/api/tags", timeout=0.25)
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def _content_hash(data: bytes) -> str:
+    """128-bit hex digest of raw bytes: xxh3 when available, blake2b otherwise"""
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _log_digest(text: str) -> str:
+    """Short content hash used as a cache key for large log strings"""
+    return _content_hash(text.encode('utf-8', 'ignore'))
+
+
+def result_fingerprint(result: AnalysisResult) -> str:
+    """Content hash of an analysis result, used to key per-result render caches"""
+    return _content_hash(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class _UncachedResult(Exception):
+    """Carries a failed AnalysisResult out of the cache so it is not memoized"""
+    def __init__(self, result: AnalysisResult):
+        super().__init__(result.error)
+        self.result = result
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _cached_analyze(log_hash: str, backend_value: str, layer2: bool, multi: bool,
+                    _log_content: str, _progress_cb=None) -> AnalysisResult:
+    analyzer = load_analyzer(BackendType(backend_value))
+    if multi:
+        result = analyzer.analyze_multi(_log_content, progress_cb=_progress_cb, enable_layer2=layer2)
+    else:
+        result = analyzer.analyze(_log_content, progress_cb=_progress_cb, enable_layer2=layer2)
+    if not result.success:
+        raise _UncachedResult(result)
+    return result
+
+
+def analyze_log(log_content: str, backend: BackendType, layer2: bool, multi: bool,
+                progress_cb=None) -> AnalysisResult:
+    """Run the analysis, reusing the previous result for identical inputs"""
+    try:
+        return _cached_analyze(_log_digest(log_content), backend.value, layer2, multi,
+                               log_content, progress_cb)
+    except _UncachedResult as e:
+        return e.result
+
+
+def control_stats_html(kb_count, backend: BackendType) -> str:
+    """Knowledge Base and Avg Speed stats for the control bar; kb_count is None until the analyzer loads"""
+    if kb_count is None:
+        kb_html = '<span class="stat-value empty">—</span>'
+    else:
+        status_class = "online" if kb_count > 0 else "offline"
+        status_text = "Online" if kb_count > 0 else "Offline"
+        kb_html = f"""<span class="stat-value">{kb_count}</span>
+                <span class="status-badge {status_class}">● {status_text}</span>"""
+    speed = "<10s" if backend == BackendType.GROQ_API else ("20-33s" if backend == BackendType.CLAUDE_API else "15-30s")
+    return f"""
+        <div class="control-stats">
+            <div class="kb-status">
+                <span class="stat-label">Knowledge Base</span><br>
+                {kb_html}
+            </div>
+            <div class="kb-status">
+                <span class="stat-label">Avg Speed</span><br>
+                <span class="stat-value">{speed}</span>
+            </div>
+        </div>
+        """
+
+
+_SECTION_HEADER_TMPL = """
+    <div class="section-header">
+        <div class="section-icon {kind}">{icon}</div>
+        <div class="section-title">{title}</div>
+        <div class="section-count">{count}</div>
+    </div>
+    """.strip()
+
+
+def section_header_html(kind: str, icon: str, title: str, count) -> str:
+    """Results section heading with its item count badge"""
+    return _SECTION_HEADER_TMPL.format(kind=kind, icon=icon, title=title, count=count)
+
+
+_METRIC_CARD_TMPL = """
     <div class="metric-card {severity_class}">
         <div class="metric-label">{label}</div>
         <div class="metric-value">
@@ -718,134 +988,298 @@ def render_metric_card(label, value, icon, severity_class=""):
             {value}
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """.strip()
 
 
-def render_contact_card(contact: Contact):
-    """Render a professional contact card"""
-    # Build escalation HTML properly
-    escalation_html = ""
-    if contact.escalation_contact:
-        time_tag = f'<span class="card-tag">after {contact.escalation_time}</span>' if contact.escalation_time else ''
-        escalation_html = f'<div class="card-footer"><span class="card-tag escalation">⚡ Escalate: {contact.escalation_contact}</span>{time_tag}</div>'
-    
-    phone_html = f"<div class='card-body'>📞 {contact.phone}</div>" if contact.phone else ""
-    
-    st.markdown(f"""
+def metric_grid_html(cards) -> str:
+    """All metric cards inside the .metrics-grid layout, as one markdown payload"""
+    items = '\n'.join(
+        _METRIC_CARD_TMPL.format(label=label, value=html.escape(value), icon=icon, severity_class=sev)
+        for label, value, icon, sev in cards
+    )
+    return f'<div class="metrics-grid">\n{items}\n</div>'
+
+
+# Card markup templates, filled with str.format by the renderers below
+_CONTACT_CARD_TMPL = """
     <div class="info-card">
         <div class="card-header">
             <div class="card-avatar contact">👤</div>
             <div class="card-meta">
-                <div class="card-title">{html.escape(contact.name)}</div>
-                <div class="card-subtitle">{html.escape(contact.role)}</div>
+                <div class="card-title">{name}</div>
+                <div class="card-subtitle">{role}</div>
             </div>
         </div>
-        <div class="card-body">📧 {html.escape(contact.email)}</div>
+        <div class="card-body">📧 {email}</div>
         {phone_html}
         {escalation_html}
     </div>
-    """, unsafe_allow_html=True)
-
+    """
+_CONTACT_PHONE_TMPL = "<div class='card-body'>📞 {phone}</div>"
+_CONTACT_ESCALATION_TMPL = '<div class="card-footer"><span class="card-tag escalation">⚡ Escalate: {contact}</span>{time_tag}</div>'
+_CONTACT_ESCALATION_TIME_TMPL = '<span class="card-tag">after {time}</span>'
 
-def render_solution_card(solution: Solution):
-    """Render a professional solution card - shows ALL steps"""
-    steps_html = ""
-    for i, step in enumerate(solution.steps, 1):
-        steps_html += f"<div class='action-item'><span class='action-number immediate'>{i}</span><span class='action-text'>{html.escape(step)}</span></div>"
-    
-    st.markdown(f"""
+_SOLUTION_CARD_TMPL = """
     <div class="info-card">
         <div class="card-header">
             <div class="card-avatar solution">🔧</div>
             <div class="card-meta">
-                <div class="card-title">{html.escape(solution.title)}</div>
-                <div class="card-subtitle">⏱️ {html.escape(solution.duration)} • 👤 {html.escape(solution.owner.name)}</div>
+                <div class="card-title">{title}</div>
+                <div class="card-subtitle">⏱️ {duration} • 👤 {owner}</div>
             </div>
         </div>
         <div class="action-list">
             {steps_html}
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """
+_SOLUTION_STEP_TMPL = "<div class='action-item'><span class='action-number immediate'>{number}</span><span class='action-text'>{step}</span></div>"
 
+_INCIDENT_CARD_TMPL = """
+    <div class="incident-card">
+        <div class="incident-header">
+            <span class="incident-id">{id}</span>
+            <span class="incident-severity {severity_class}">{severity}</span>
+            <span class="incident-match">{similarity} match</span>
+        </div>
+        <div class="incident-title">{title}</div>
+        <div class="incident-stats">
+            <span class='incident-stat'>📅 {date}</span>
+            {impact_html}
+        </div>
+        {resolution_html}
+    </div>
+    """
+_INCIDENT_STAT_TMPL = "<span class='incident-stat'>{icon} {value}</span>"
+_INCIDENT_RESOLUTION_TMPL = "<div class='incident-resolution'>✅ Resolved in {time} by {owner}</div>"
 
-def render_incident_card(inc):
-    """Render a professional incident card - FIXED VERSION"""
-    severity = inc.get('severity', 'MEDIUM').lower()
-    
+
+def _html_block(markup: str) -> str:
+    """Flatten card markup into one CommonMark HTML block: no indentation, no blank lines"""
+    # A blank line (e.g. an empty {placeholder} line, or a newline inside a value) ends
+    # the HTML block, and an indented line after it renders as a literal code block
+    return '\n'.join(line.strip() for line in markup.splitlines() if line.strip())
+
+
+# Card HTML is a pure function of the card's fields, and the same contacts,
+# runbooks and past incidents recur across analyses, so cache by content
+@functools.lru_cache(maxsize=512)
+def _contact_card_html(name, role, email, phone, escalation_contact, escalation_time) -> str:
+    escalation_html = ""
+    if escalation_contact:
+        time_tag = _CONTACT_ESCALATION_TIME_TMPL.format(time=html.escape(escalation_time)) if escalation_time else ''
+        escalation_html = _CONTACT_ESCALATION_TMPL.format(contact=html.escape(escalation_contact), time_tag=time_tag)
+    
+    return _html_block(_CONTACT_CARD_TMPL.format(
+        name=html.escape(name),
+        role=html.escape(role),
+        email=html.escape(email),
+        phone_html=_CONTACT_PHONE_TMPL.format(phone=html.escape(phone)) if phone else "",
+        escalation_html=escalation_html
+    ))
+
+
+def contact_card_html(contact: Contact) -> str:
+    """Build the HTML for a professional contact card"""
+    return _contact_card_html(contact.name, contact.role, contact.email, contact.phone,
+                              contact.escalation_contact, contact.escalation_time)
+
+
+@functools.lru_cache(maxsize=512)
+def _solution_card_html(title, duration, owner, steps) -> str:
+    steps_html = "".join(
+        _SOLUTION_STEP_TMPL.format(number=i, step=html.escape(step))
+        for i, step in enumerate(steps, 1)
+    )
+    
+    return _html_block(_SOLUTION_CARD_TMPL.format(
+        title=html.escape(title),
+        duration=html.escape(duration),
+        owner=html.escape(owner),
+        steps_html=steps_html
+    ))
+
+
+def solution_card_html(solution: Solution) -> str:
+    """Build the HTML for a professional solution card - shows ALL steps"""
+    return _solution_card_html(solution.title, solution.duration, solution.owner.name, tuple(solution.steps))
+
+
+def incident_card_html(inc) -> str:
+    """Build the HTML for a professional incident card - FIXED VERSION"""
+    return _incident_card_html(tuple(inc.items()))
+
+
+@functools.lru_cache(maxsize=512)
+def _incident_card_html(items) -> str:
+    inc = dict(items)
     # Clean title - strip HTML tags and escape
     title_raw = inc.get('title', 'No description available')
-    title_clean = re.sub(r'<[^>]+>', '', str(title_raw))
-    title_escaped = html.escape(title_clean)
+    title_clean = _TAG_RE.sub('', str(title_raw))
     
     # Build impact stats
     impact_html = ""
     if inc.get('financial_impact'):
-        impact_html += f"<span class='incident-stat'>💰 {html.escape(str(inc.get('financial_impact')))}</span>"
+        impact_html += _INCIDENT_STAT_TMPL.format(icon='💰', value=html.escape(str(inc.get('financial_impact'))))
     if inc.get('users_affected'):
-        impact_html += f"<span class='incident-stat'>👥 {html.escape(str(inc.get('users_affected')))}</span>"
+        impact_html += _INCIDENT_STAT_TMPL.format(icon='👥', value=html.escape(str(inc.get('users_affected'))))
     
     # Build resolution section separately (not nested f-string)
     resolution_html = ""
     resolution_time = inc.get('resolution_time', '')
     owner = inc.get('owner', '')
     if resolution_time and owner and str(resolution_time).lower() != 'unknown' and str(owner).lower() != 'unknown':
-        # Build as single line to avoid formatting issues
-        resolution_html = f"<div class='incident-resolution'>✅ Resolved in {html.escape(str(resolution_time))} by {html.escape(str(owner))}</div>"
-    
-    # Build the full card HTML
-    card_html = f"""
-    <div class="incident-card">
-        <div class="incident-header">
-            <span class="incident-id">{html.escape(inc.get('id', 'INC-XXXX'))}</span>
-            <span class="incident-severity {severity}">{html.escape(inc.get('severity', 'MEDIUM'))}</span>
-            <span class="incident-match">{html.escape(str(inc.get('similarity', 'N/A')))} match</span>
-        </div>
-        <div class="incident-title">{title_escaped}</div>
-        <div class="incident-stats">
-            <span class='incident-stat'>📅 {html.escape(inc.get('date', 'Date unknown'))}</span>
-            {impact_html}
-        </div>
-        {resolution_html}
-    </div>
-    """
-    
-    st.markdown(card_html, unsafe_allow_html=True)
+        resolution_html = _INCIDENT_RESOLUTION_TMPL.format(time=html.escape(str(resolution_time)), owner=html.escape(str(owner)))
+    
+    return _html_block(_INCIDENT_CARD_TMPL.format(
+        id=html.escape(inc.get('id', 'INC-XXXX')),
+        severity_class=inc.get('severity', 'MEDIUM').lower(),
+        severity=html.escape(inc.get('severity', 'MEDIUM')),
+        similarity=html.escape(str(inc.get('similarity', 'N/A'))),
+        title=html.escape(title_clean),
+        date=html.escape(inc.get('date', 'Date unknown')),
+        impact_html=impact_html,
+        resolution_html=resolution_html
+    ))
+
+
+def incident_cards_html(incidents) -> str:
+    """All incident cards as a single markdown payload"""
+    return '\n'.join(incident_card_html(inc) for inc in incidents)
 
 
-def render_timeline_event(event):
-    """Render a timeline event"""
-    st.markdown(f"""
+_TIMELINE_ITEM_TMPL = """
     <div class="timeline-item">
-        <div class="timeline-time">{html.escape(event['timestamp'])}</div>
+        <div class="timeline-time">{timestamp}</div>
         <div class="timeline-content">
-            <span class="timeline-component">[{html.escape(event['component'])}]</span> {html.escape(event['message'])}
+            <span class="timeline-component">[{component}]</span> {message}
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """.strip()
+
+
+def timeline_event_html(event) -> str:
+    """Build the HTML for a timeline event"""
+    return _html_block(_TIMELINE_ITEM_TMPL.format(
+        timestamp=html.escape(event['timestamp']),
+        component=html.escape(event['component']),
+        message=html.escape(event['message'])
+    ))
+
+
+def timeline_html(events) -> str:
+    """The timeline rail and its events as a single markdown payload"""
+    items = '\n'.join(timeline_event_html(event) for event in events)
+    return f'<div class="timeline">\n{items}\n</div>'
+
+
+_CHAIN_ARROW = "<span class='chain-arrow'>→</span>"
+
+
+def causal_chain_html(chain) -> str:
+    """Root-cause chain as arrow-separated nodes, the last one marked as root"""
+    nodes = [f"<span class='chain-node'>{html.escape(event)}</span>" for event in chain[:-1]]
+    nodes.append(f"<span class='chain-node root'>{html.escape(chain[-1])}</span>")
+    return f"<div class='causal-chain'>{_CHAIN_ARROW.join(nodes)}</div>"
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def result_fragments(result_key: str, _result: AnalysisResult) -> dict:
+    """Static HTML for the results page, built once per result fingerprint"""
+    ma = _result.multi_agent
+    chain = ma.root_cause.causal_chain if ma is not None and ma.root_cause else None
+    metrics = [
+        ("Severity", f"{_SEVERITY_ICONS.get(_result.severity, '⚪')} {_result.severity}", "", _result.severity.lower()),
+        ("System", _result.system, "", ""),
+        ("Confidence", f"{_result.confidence:.0%}", "", ""),
+        ("KB Matches", str(_result.knowledge_sources), "", ""),
+        ("Component", _result.affected_component or "N/A", "", "")
+    ]
+    return {
+        'metrics': metric_grid_html(metrics),
+        'contacts': [contact_card_html(c) for c in _result.contacts[:3]],
+        'solutions': [solution_card_html(sol) for sol in _result.solutions],
+        'incidents': incident_cards_html(_result.related_incidents[:5]),
+        'timeline': timeline_html(_result.timeline[:15]),
+        'causal_chain': causal_chain_html(chain) if chain else "",
+    }
+
+
+def _line_severity(line: str):
+    """Return the highest severity rank (1-3) found in the line, or None"""
+    if _SEVERITY_AC is None:
+        m = _SEVERITY_RE.match(line)
+        return m.lastindex if m else None
+    best = None
+    for _, rank in _SEVERITY_AC.iter(line.lower()):
+        if rank == 1:
+            return 1
+        if best is None or rank < best:
+            best = rank
+    return best
+
+
+def _escape_buffer(text: str) -> str:
+    # Escape the whole buffer in one go instead of once per line; most logs
+    # contain nothing to escape, in which case the text is returned as-is
+    return html.escape(text) if _HTML_UNSAFE_RE.search(text) else text
+
+
+def _colorize_line(match) -> str:
+    # The buffer is already HTML-escaped; entities never contain a severity keyword
+    line = match.group(0)
+    if not line.strip():
+        return ''
+    return _SEVERITY_SPANS[_line_severity(line)].format(line)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _highlight_cached(log_hash: str, log_len: int, _log_text: str) -> str:
+    # _log_text is skipped by Streamlit's hasher; the digest is the cache key
+    if _log_text.count('\n') <= _HIGHLIGHT_MAX_LINES:
+        return _LINE_RE.sub(_colorize_line, _escape_buffer(_log_text))
+    
+    # Huge logs: only render head + tail so the browser doesn't choke on the DOM
+    lines = _log_text.split('\n')
+    head = '\n'.join(lines[:_HIGHLIGHT_HEAD_LINES])
+    tail = '\n'.join(lines[-_HIGHLIGHT_TAIL_LINES:])
+    omitted = len(lines) - _HIGHLIGHT_HEAD_LINES - _HIGHLIGHT_TAIL_LINES
+    return '\n'.join([
+        _LINE_RE.sub(_colorize_line, _escape_buffer(head)),
+        _TRUNCATION_MARKER.format(count=omitted),
+        _LINE_RE.sub(_colorize_line, _escape_buffer(tail)),
+    ])
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _log_lines_cached(log_hash: str, _log_text: str) -> list:
+    return _log_text.split('\n')
+
+
+def log_tail(log_text: str, n: int) -> str:
+    """Last n lines of the log, found by scanning back from the end"""
+    # A trailing newline ends the last line; it doesn't start another one
+    pos = len(log_text) - 1 if log_text.endswith('\n') else len(log_text)
+    for _ in range(n):
+        pos = log_text.rfind('\n', 0, pos)
+        if pos < 0:
+            return log_text
+    return log_text[pos + 1:]
+
+
+def log_lines(log_text: str) -> list:
+    """The log split into lines, cached per log digest"""
+    return _log_lines_cached(_log_digest(log_text), log_text)
 
 
 def highlight_errors(log_text: str) -> str:
-    lines = log_text.split('\n')
-    highlighted = []
-    for line in lines:
-        if not line.strip():
-            highlighted.append('')
-            continue
-        safe_line = html.escape(line)
-        line_lower = line.lower()
-        if any(word in line_lower for word in ['error', 'critical', 'fail', 'exception', 'fatal', '错误']):
-            highlighted.append(f'<span style="color: #ef4444; font-weight: 500;">{safe_line}</span>')
-        elif any(word in line_lower for word in ['warning', 'warn', '警告']):
-            highlighted.append(f'<span style="color: #f59e0b; font-weight: 500;">{safe_line}</span>')
-        elif any(word in line_lower for word in ['info', 'debug', 'trace']):
-            highlighted.append(f'<span style="color: #06b6d4;">{safe_line}</span>')
-        else:
-            highlighted.append(f'<span style="color: #64748b;">{safe_line}</span>')
-    return '\n'.join(highlighted)
+    return _highlight_cached(_log_digest(log_text), len(log_text), log_text)
 
 
 def format_for_slack(result: AnalysisResult) -> str:
+    c0 = result.contacts[0] if result.contacts else None
+    s0 = result.solutions[0] if result.solutions else None
+    
     analysis_text = ""
     if hasattr(result, 'multi_agent') and result.multi_agent:
         ma = result.multi_agent
@@ -856,80 +1290,291 @@ def format_for_slack(result: AnalysisResult) -> str:
     else:
         analysis_text = result.analysis[:300] + "..." if len(result.analysis) > 300 else result.analysis
     
-    slack_message = f"""🚨 *INCIDENT ALERT - {result.severity}*
+    lines = [
+        f"🚨 *INCIDENT ALERT - {result.severity}*",
+        "",
+        f"*System*: {result.system} ({result.affected_component or 'multiple components'})",
+        f"*Severity*: {result.severity}",
+        f"*Confidence*: {result.confidence:.0%}",
+        f"*When*: {result.timestamp or 'Unknown'}",
+        "",
+        analysis_text,
+        "",
+        f"*Primary Contact*: {c0.name if c0 else 'Unknown'}",
+        f"• Email: {c0.email if c0 else 'N/A'}",
+        f"• Phone: {c0.phone if (c0 and c0.phone) else 'N/A'}",
+    ]
+    
+    if c0 and c0.escalation_contact:
+        escalation = f"• Escalate to: {c0.escalation_contact}"
+        if c0.escalation_time:
+            escalation += f" after {c0.escalation_time}"
+        lines.append(escalation)
+    
+    lines.append("")
+    lines.append("*Immediate Actions*:")
+    if s0 and s0.steps:
+        lines.extend(f"{i}. {step}" for i, step in enumerate(s0.steps[:5], 1))
+    else:
+        lines.append("See full runbook in system")
+    
+    return "\n".join(lines) + "\n"
 
-*System*: {result.system} ({result.affected_component or 'multiple components'})
-*Severity*: {result.severity}
-*Confidence*: {result.confidence:.0%}
-*When*: {result.timestamp or 'Unknown'}
 
-{analysis_text}
+# Clipboard snippet for the Slack button; only the JSON payload changes per call.
+# Markdown strips <script>, so it goes through st.html with JavaScript enabled
+_CLIPBOARD_SCRIPT = "<script>navigator.clipboard.writeText({SLACK_JSON});</script>"
 
-*Primary Contact*: {result.contacts[0].name if result.contacts else 'Unknown'}
-• Email: {result.contacts[0].email if result.contacts else 'N/A'}
-• Phone: {result.contacts[0].phone if (result.contacts and result.contacts[0].phone) else 'N/A'}
-"""
-    
-    if result.contacts and result.contacts[0].escalation_contact:
-        slack_message += f"• Escalate to: {result.contacts[0].escalation_contact}"
-        if result.contacts[0].escalation_time:
-            slack_message += f" after {result.contacts[0].escalation_time}"
-        slack_message += "\n"
+
+_SCRIPT_JSON_ESCAPES = str.maketrans({'<': '\\u003c', '>': '\\u003e', '&': '\\u0026'})
+
+
+def script_json(value) -> str:
+    """JSON that is safe inside a <script> tag: no </script> or <!-- can close or comment it out"""
+    return json.dumps(value).translate(_SCRIPT_JSON_ESCAPES)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def slack_payload(result_key: str, _result: AnalysisResult) -> tuple:
+    """Slack message text and its script-safe JSON form, built once per result"""
+    text = format_for_slack(_result)
+    return text, script_json(text)
+
+
+@functools.lru_cache(maxsize=1)
+def reportlab_available() -> bool:
+    """Check for reportlab without importing it (PDF export is optional)"""
+    return importlib.util.find_spec("reportlab") is not None
+
+
+def _export_rows(result: AnalysisResult) -> tuple:
+    """Contact and solution fields escaped once for reportlab's Paragraph markup"""
+    esc = functools.partial(html.escape, quote=False)
+    contacts = [
+        (esc(c.name), esc(c.role), esc(c.email), esc(c.phone or 'N/A'),
+         esc(c.escalation_contact) if c.escalation_contact else None)
+        for c in result.contacts
+    ]
+    solutions = [
+        (esc(sol.title), esc(sol.owner.name), esc(sol.duration), [esc(step) for step in sol.steps])
+        for sol in result.solutions
+    ]
+    return contacts, solutions
+
+
+def _pdf_contact_markup(name, role, email, phone, escalation) -> str:
+    """Paragraph markup for one escaped contact row"""
+    markup = f"<b>{name}</b> - {role}<br/>Email: {email}<br/>Phone: {phone}"
+    if escalation:
+        markup += f"<br/>Escalate to: {escalation}"
+    return markup
+
+
+@functools.lru_cache(maxsize=None)
+def _pdf_styles() -> dict:
+    """Stylesheet, title style and table styles for the PDF report, built once"""
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    from reportlab.lib import colors
+
+    styles = getSampleStyleSheet()
+    return {
+        'sheet': styles,
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#6366f1'),
+            spaceAfter=30
+        ),
+        'meta_table': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+        ]),
+        'timeline_table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP')
+        ]),
+    }
+
+
+class _PdfSink:
+    """Write target for reportlab that keeps the rendered PDF bytes without copying"""
+    def __init__(self):
+        self.data = b""
+
+    def write(self, chunk: bytes):
+        # reportlab writes the finished document in one call; b"" + chunk is chunk itself
+        self.data += chunk
+
+
+def build_pdf_report(result: AnalysisResult, elapsed: float) -> bytes:
+    """Render the incident report PDF (reportlab is imported on first use)"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+    buffer = _PdfSink()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                        rightMargin=72, leftMargin=72,
+                        topMargin=72, bottomMargin=18)
+    
+    pdf_styles = _pdf_styles()
+    styles = pdf_styles['sheet']
+    story = []
+    
+    # Title
+    story.append(Paragraph("LogGuard Incident Report", pdf_styles['title']))
+    story.append(Spacer(1, 12))
+    
+    # Metadata
+    meta_data = [
+        ['Incident ID:', f"INC-{int(time.time())}"],
+        ['System:', result.system],
+        ['Severity:', result.severity],
+        ['Component:', result.affected_component or "N/A"],
+        ['Confidence:', f"{result.confidence:.0%}"],
+        ['Analysis Time:', f"{elapsed:.2f}s"]
+    ]
+    meta_table = Table(meta_data, colWidths=[2*inch, 4*inch])
+    meta_table.setStyle(pdf_styles['meta_table'])
+    story.append(meta_table)
+    story.append(Spacer(1, 20))
+    
+    # Analysis Summary
+    story.append(Paragraph("Analysis Summary", styles['Heading2']))
+    analysis_text = result.analysis if not result.multi_agent else (
+        result.multi_agent.root_cause.trigger if result.multi_agent.root_cause else result.analysis
+    )
+    story.append(Paragraph(analysis_text, styles['BodyText']))
+    story.append(Spacer(1, 12))
+    
+    contact_rows, solution_rows = _export_rows(result)
+    
+    # Contacts
+    if contact_rows:
+        story.append(Paragraph("Key Contacts", styles['Heading2']))
+        contact_paras = [Paragraph(_pdf_contact_markup(*row), styles['BodyText']) for row in contact_rows]
+        story.extend(itertools.chain.from_iterable((para, Spacer(1, 6)) for para in contact_paras))
+        story.append(Spacer(1, 12))
+    
+    # Solutions
+    if solution_rows:
+        story.append(Paragraph("Recommended Solutions", styles['Heading2']))
+        for i, (title, owner, duration, steps) in enumerate(solution_rows, 1):
+            story.extend([
+                Paragraph(f"<b>Solution {i}: {title}</b>", styles['Heading3']),
+                Paragraph(f"Owner: {owner} | Duration: {duration}", styles['Italic']),
+                *[Paragraph(f"• {step}", styles['BodyText']) for step in steps],
+                Spacer(1, 6),
+            ])
+    
+    # Timeline
+    if result.timeline:
+        story.append(Paragraph("Event Timeline", styles['Heading2']))
+        timeline_data = [['Time', 'Component', 'Event']] + [
+            [event['timestamp'], event['component'],
+             event['message'][:100] + '...' if len(event['message']) > 100 else event['message']]
+            for event in result.timeline[:10]
+        ]
+        timeline_table = Table(timeline_data, colWidths=[1.5*inch, 1.2*inch, 3.3*inch])
+        timeline_table.setStyle(pdf_styles['timeline_table'])
+        story.append(timeline_table)
     
-    slack_message += "\n*Immediate Actions*:\n"
-    if result.solutions and result.solutions[0].steps:
-        for i, step in enumerate(result.solutions[0].steps[:5], 1):
-            slack_message += f"{i}. {step}\n"
-    else:
-        slack_message += "See full runbook in system\n"
+    doc.build(story)
     
-    return slack_message
+    return buffer.data
 
 
-def load_example_logs():
-    """Load example logs from test_logs/ folder or use hardcoded fallback - FIXED"""
-    example_logs = {}
-    test_logs_dir = "test_logs"
-    
-    # Try to load from test_logs folder first
-    if os.path.exists(test_logs_dir) and os.path.isdir(test_logs_dir):
-        log_files = [f for f in os.listdir(test_logs_dir) if f.endswith('.log')]
-        for log_file in sorted(log_files):
-            try:
-                with open(os.path.join(test_logs_dir, log_file), 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    # Create friendly name from filename
-                    friendly_name = log_file.replace('.log', '').replace('_', ' ').title()
-                    example_logs[friendly_name] = content
-            except Exception as e:
-                st.warning(f"Could not load {log_file}: {e}")
-    
-    # Fallback to hardcoded examples if no test_logs found
-    if not example_logs:
-        example_logs = {
-            "Database Table Deleted": """[2026-01-30 09:42:17.789] 错误 [数据库] SQL执行异常: SELECT * FROM orders WHERE order_id = ?
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_pdf_report(result_key: str, elapsed: float, _result: AnalysisResult) -> bytes:
+    """PDF bytes for a result, built once per result fingerprint"""
+    return build_pdf_report(_result, elapsed)
+
+
+def deferred_pdf_report(result_key: str, elapsed: float, result: AnalysisResult) -> bytes:
+    """Download-button callable: runs on click, outside the script run, so st.error can't be shown"""
+    try:
+        return cached_pdf_report(result_key, elapsed, result)
+    except Exception:
+        # Streamlit reports the failed download to the browser; keep the cause in the server log
+        logger.exception("PDF export failed for result %s", result_key)
+        raise
+
+
+# Hardcoded examples used when test_logs/ is missing or empty (read-only, shared by every session)
+_FALLBACK_EXAMPLE_LOGS = MappingProxyType({
+    "Database Table Deleted": """[2026-01-30 09:42:17.789] 错误 [数据库] SQL执行异常: SELECT * FROM orders WHERE order_id = ?
 [2026-01-30 09:42:17.890] 错误 [数据库] 错误信息: 表 'orders' 不存在 (Error Code: 1146)
 [2026-01-30 09:42:18.123] 信息 [数据库DBA] DBA已通知，检查数据迁移状态
 [2026-01-30 09:42:35.456] 信息 [数据库] 成功恢复表 'orders' 从备份库""",
-            
-            "Memory Spike & GC": """[2026-01-30 08:35:47.234] 警告 [内存监控] 服务器_A 内存使用率: 92%，进程: java(PID: 2847)
+    
+    "Memory Spike & GC": """[2026-01-30 08:35:47.234] 警告 [内存监控] 服务器_A 内存使用率: 92%，进程: java(PID: 2847)
 [2026-01-30 08:35:47.567] 信息 [内存监控] 触发垃圾回收, 目标进程 PID: 2847
 [2026-01-30 08:35:49.123] 信息 [内存监控] 垃圾回收完成，内存释放: 1.34 GB，当前使用率: 58%""",
-            
-            "Disk Space Critical": """[2026-01-30 09:05:32.234] 错误 [磁盘存储] 警告: 日志磁盘使用率达到 76%，可用空间: 2.4GB
+    
+    "Disk Space Critical": """[2026-01-30 09:05:32.234] 错误 [磁盘存储] 警告: 日志磁盘使用率达到 76%，可用空间: 2.4GB
 [2026-01-30 09:06:01.456] 警告 [磁盘存储] 日志磁盘使用率继续上升至 82%，触发压缩任务
 [2026-01-30 09:06:15.789] 信息 [磁盘压缩] 开始压缩旧日志文件...
 [2026-01-30 09:06:45.123] 信息 [磁盘压缩] 成功压缩 12 个文件，释放空间 1.2GB""",
-            
-            "Payment Gateway Timeout": """[2026-01-30 08:29:12.345] 错误 [API网关] 连接超时异常，目标服务: 支付服务 (服务器_B:8443)
+    
+    "Payment Gateway Timeout": """[2026-01-30 08:29:12.345] 错误 [API网关] 连接超时异常，目标服务: 支付服务 (服务器_B:8443)
 [2026-01-30 08:29:13.456] 警告 [API网关] Stripe API 响应超时 (30秒)
 [2026-01-30 08:29:14.567] 错误 [支付处理] 队列积压: 342 笔交易待处理"""
-        }
+})
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _scan_test_logs(test_logs_dir: str = "test_logs") -> dict:
+    """Read every .log file in test_logs/ (cached so reruns skip the disk I/O)"""
+    example_logs = {}
+    try:
+        with os.scandir(test_logs_dir) as it:
+            entries = sorted((e for e in it if e.name.endswith('.log') and e.is_file()), key=lambda e: e.name)
+    except OSError:
+        # Missing or unreadable folder: caller falls back to the built-in examples
+        return example_logs
     
+    for entry in entries:
+        try:
+            with open(entry.path, 'r', encoding='utf-8') as f:
+                content = f.read()
+                # Create friendly name from filename
+                friendly_name = entry.name.replace('.log', '').replace('_', ' ').title()
+                example_logs[friendly_name] = content
+        except Exception as e:
+            st.warning(f"Could not load {entry.name}: {e}")
     return example_logs
 
 
+def load_example_logs():
+    """Load example logs from test_logs/ folder or use hardcoded fallback - FIXED"""
+    return _scan_test_logs() or _FALLBACK_EXAMPLE_LOGS
+
+
+def inject_css():
+    """Emit the app stylesheet"""
+    # Must run on every rerun: Streamlit removes elements a rerun doesn't re-emit.
+    # st.html sends style-only content to the event container, skipping the
+    # markdown parser and taking no space in the layout
+    st.html(_APP_CSS)
+
+
 def main():
+    inject_css()
+    
     # ===== HEADER =====
     st.markdown("""
     <div class="app-header">
@@ -941,26 +1586,18 @@ def main():
     """, unsafe_allow_html=True)
     
     # ===== CONTROL BAR =====
-    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
-    
-    def is_ollama_available():
-        try:
-            import requests
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+    col1, col2, col3 = st.columns([2, 1, 2])
     
     ollama_available = is_ollama_available()
     
     with col1:
         if ollama_available:
-            backend_choice = st.selectbox("Backend", ["⚡ Groq API", "☁️ Claude API", "🏠 Local Ollama"])
+            backend_choice = st.selectbox("Backend", list(_BACKEND_CHOICES))
         else:
             st.markdown("""
-            <div style="padding: 0.5rem 1rem; background: var(--bg-secondary); border-radius: 8px; border: 1px solid var(--border-subtle);">
-                <span style="font-size: 0.75rem; color: var(--text-muted); text-transform: uppercase; font-weight: 600;">Backend</span><br>
-                <span style="color: var(--accent-success); font-weight: 500;">⚡ Groq API</span>
+            <div class="backend-badge">
+                <span class="stat-label">Backend</span><br>
+                <span class="backend-name">⚡ Groq API</span>
             </div>
             """, unsafe_allow_html=True)
             backend_choice = "⚡ Groq API"
@@ -971,49 +1608,22 @@ def main():
             use_layer2_sanitization = st.toggle("🔒 Layer 2", value=True)
         else:
             st.markdown("""
-            <div style="text-align: center; opacity: 0.5; padding: 0.5rem;">
-                <span style="font-size: 0.75rem; color: var(--text-muted);">🔒 Layer 2</span><br>
-                <span style="font-size: 0.6875rem; color: var(--accent-danger);">Ollama offline</span>
+            <div class="layer2-disabled">
+                <span class="layer2-label">🔒 Layer 2</span><br>
+                <span class="layer2-reason">Ollama offline</span>
             </div>
             """, unsafe_allow_html=True)
     
     use_multi_agent = True
     
-    if "Groq" in backend_choice:
-        backend = BackendType.GROQ_API
-    elif "Claude" in backend_choice:
-        backend = BackendType.CLAUDE_API
-    else:
-        backend = BackendType.OLLAMA_LOCAL
-    
-    try:
-        analyzer = load_analyzer(backend, use_layer2_sanitization)
-    except Exception as e:
-        st.error(f"❌ Failed to initialize backend: {e}")
-        st.info("💡 Create a `.env` file with your API key:")
-        st.code("GROQ_API_KEY=gsk_your_key_here")
-        return
+    backend = _BACKEND_CHOICES[backend_choice]
     
+    # Display-only stats share one column and a single flex row. The analyzer
+    # isn't built until a log is submitted, so the KB count is a placeholder until
+    # some session has loaded this backend
     with col3:
-        kb_count = analyzer.collection.count() if analyzer.collection else 0
-        status_class = "online" if kb_count > 0 else "offline"
-        status_text = "Online" if kb_count > 0 else "Offline"
-        st.markdown(f"""
-        <div style="text-align: center;">
-            <span style="font-size: 0.75rem; color: var(--text-muted); text-transform: uppercase; font-weight: 600;">Knowledge Base</span><br>
-            <span style="font-size: 1.25rem; font-weight: 700; color: var(--text-primary);">{kb_count}</span>
-            <span class="status-badge {status_class}">● {status_text}</span>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        speed = "<10s" if backend == BackendType.GROQ_API else ("20-33s" if backend == BackendType.CLAUDE_API else "15-30s")
-        st.markdown(f"""
-        <div style="text-align: center;">
-            <span style="font-size: 0.75rem; color: var(--text-muted); text-transform: uppercase; font-weight: 600;">Avg Speed</span><br>
-            <span style="font-size: 1.25rem; font-weight: 700; color: var(--text-primary);">{speed}</span>
-        </div>
-        """, unsafe_allow_html=True)
+        stats_slot = st.empty()
+    stats_slot.markdown(control_stats_html(loaded_kb_count(backend), backend), unsafe_allow_html=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -1022,21 +1632,15 @@ def main():
     
     with st.expander("💡 Try an example log"):
         selected_example = st.selectbox("Choose example:", list(example_logs.keys()), label_visibility="collapsed")
-        if st.button("📂 Load Example", use_container_width=True):
-            st.session_state.example_log = example_logs[selected_example]
-            st.session_state.example_name = selected_example
-            st.rerun()
+        load_example = st.button("📂 Load Example", use_container_width=True)
     
     log_content = None
     analyze_button = False
     
-    if 'example_log' in st.session_state:
-        log_content = st.session_state.example_log
-        example_name = st.session_state.get('example_name', 'Example')
-        st.info(f"📄 Loaded: **{example_name}**")
-        del st.session_state.example_log
-        if 'example_name' in st.session_state:
-            del st.session_state.example_name
+    # Analyze the example in this same run rather than stashing it and rerunning
+    if load_example:
+        log_content = example_logs[selected_example]
+        st.info(f"📄 Loaded: **{selected_example}**")
         analyze_button = True
     else:
         uploaded_file = st.file_uploader("Upload log file", type=["log", "txt", "csv"], label_visibility="collapsed")
@@ -1050,28 +1654,42 @@ def main():
             
             if analyze_button:
                 try:
-                    log_content = uploaded_file.read().decode('utf-8', errors='ignore')
+                    # Decode straight from a zero-copy view of the upload buffer: no bytes
+                    # copy, and no read position that a later rerun could find at EOF
+                    with uploaded_file.getbuffer() as buf:
+                        log_content = str(buf, 'utf-8', 'ignore')
                 except Exception as e:
                     st.error(f"❌ Could not read file: {e}")
                     return
     
     # ===== ANALYSIS =====
     if log_content and analyze_button:
-        loading_messages = [
-            "🔍 Reading your log file...", "🧠 Analyzing with AI...", "📚 Searching knowledge base...",
-            "👥 Finding the right contact...", "📋 Matching runbooks...", "✅ Almost done..."
-        ]
+        try:
+            # Builds (or reuses) the backend's analyzer so the KB stat below can read it
+            load_analyzer(backend)
+        except Exception as e:
+            st.error(f"❌ Failed to initialize backend: {e}")
+            st.info("💡 Create a `.env` file with your API key:")
+            st.code("GROQ_API_KEY=gsk_your_key_here")
+            return
         
-        with st.spinner(random.choice(loading_messages)):
+        stats_slot.markdown(control_stats_html(loaded_kb_count(backend), backend), unsafe_allow_html=True)
+        
+        with st.status("🔍 Reading your log file...", expanded=False) as status:
             start_time = time.time()
-            if use_multi_agent:
-                result = analyzer.analyze_multi(log_content)
-            else:
-                result = analyzer.analyze(log_content)
-            elapsed = time.time() - start_time
+            result = analyze_log(log_content, backend, use_layer2_sanitization, use_multi_agent,
+                                 progress_cb=lambda msg: status.update(label=msg))
+            # A fresh run can't return faster than the analysis it timed, so a shorter
+            # wall-clock time means the result came from the analyze_log cache
+            from_cache = time.time() - start_time < result.processing_time
+            status.update(
+                label="✅ Analysis complete" if result.success else "❌ Analysis failed",
+                state="complete" if result.success else "error"
+            )
             
             st.session_state.analysis_result = result
-            st.session_state.analysis_elapsed = elapsed
+            st.session_state.analysis_from_cache = from_cache
+            st.session_state.analysis_key = result_fingerprint(result)
         
         if not result.success:
             st.error(f"❌ Analysis failed: {result.error}")
@@ -1080,90 +1698,56 @@ def main():
     # ===== RESULTS =====
     if 'analysis_result' in st.session_state:
         result = st.session_state.analysis_result
-        elapsed = st.session_state.analysis_elapsed
+        # Report the analysis's own timing; a cache hit's wall-clock time is near zero
+        elapsed = result.processing_time
+        result_key = st.session_state.analysis_key
         
-        st.success(f"✅ Analysis complete in {elapsed:.2f}s")
+        cached_note = " (cached result)" if st.session_state.get('analysis_from_cache') else ""
+        st.success(f"✅ Analysis complete in {elapsed:.2f}s{cached_note}")
         st.markdown("<br>", unsafe_allow_html=True)
         
-        # ===== METRICS DASHBOARD =====
-        severity_class = result.severity.lower()
-        severity_icons = {"CRITICAL": "🔴", "ERROR": "🟠", "WARNING": "🟡", "INFO": "🟢"}
-        
-        cols = st.columns(5)
-        metrics = [
-            ("Severity", f"{severity_icons.get(result.severity, '⚪')} {result.severity}", severity_class),
-            ("System", result.system, ""),
-            ("Confidence", f"{result.confidence:.0%}", ""),
-            ("KB Matches", str(result.knowledge_sources), ""),
-            ("Component", result.affected_component or "N/A", "")
-        ]
+        fragments = result_fragments(result_key, result)
         
-        for col, (label, value, sev) in zip(cols, metrics):
-            with col:
-                render_metric_card(label, value, "", sev)
+        # ===== METRICS DASHBOARD =====
+        st.markdown(fragments['metrics'], unsafe_allow_html=True)
         
         if result.confidence_explanation:
             st.caption(result.confidence_explanation)
         
         # ===== CONTACTS =====
         if result.contacts:
-            st.markdown("""
-            <div class="section-header">
-                <div class="section-icon contacts">📞</div>
-                <div class="section-title">Who to Contact</div>
-                <div class="section-count">{count}</div>
-            </div>
-            """.format(count=len(result.contacts)), unsafe_allow_html=True)
+            st.markdown(section_header_html("contacts", "📞", "Who to Contact", len(result.contacts)),
+                        unsafe_allow_html=True)
             
             cols = st.columns(min(3, len(result.contacts)))
-            for col, contact in zip(cols, result.contacts[:3]):
+            for col, card in zip(cols, fragments['contacts']):
                 with col:
-                    render_contact_card(contact)
+                    st.markdown(card, unsafe_allow_html=True)
         
         # ===== SOLUTIONS =====
         if result.solutions:
-            st.markdown("""
-            <div class="section-header">
-                <div class="section-icon solutions">🛠️</div>
-                <div class="section-title">Solutions from Runbooks</div>
-                <div class="section-count">{count}</div>
-            </div>
-            """.format(count=len(result.solutions)), unsafe_allow_html=True)
+            st.markdown(section_header_html("solutions", "🛠️", "Solutions from Runbooks", len(result.solutions)),
+                        unsafe_allow_html=True)
             
-            render_solution_card(result.solutions[0])
+            st.markdown(fragments['solutions'][0], unsafe_allow_html=True)
             
             if len(result.solutions) > 1:
                 with st.expander(f"📋 View {len(result.solutions) - 1} more solutions"):
-                    for sol in result.solutions[1:]:
-                        render_solution_card(sol)
+                    st.markdown('\n'.join(fragments['solutions'][1:]), unsafe_allow_html=True)
         
         # ===== RELATED INCIDENTS =====
         if result.related_incidents:
-            st.markdown("""
-            <div class="section-header">
-                <div class="section-icon incidents">🎟️</div>
-                <div class="section-title">Related Past Incidents</div>
-                <div class="section-count">{count}</div>
-            </div>
-            """.format(count=len(result.related_incidents)), unsafe_allow_html=True)
+            st.markdown(section_header_html("incidents", "🎟️", "Related Past Incidents", len(result.related_incidents)),
+                        unsafe_allow_html=True)
             
-            for inc in result.related_incidents[:5]:
-                render_incident_card(inc)
+            st.markdown(fragments['incidents'], unsafe_allow_html=True)
         
         # ===== TIMELINE =====
         if result.timeline:
-            st.markdown("""
-            <div class="section-header">
-                <div class="section-icon timeline">⏱️</div>
-                <div class="section-title">Incident Timeline</div>
-                <div class="section-count">{count} events</div>
-            </div>
-            """.format(count=len(result.timeline)), unsafe_allow_html=True)
+            st.markdown(section_header_html("timeline", "⏱️", "Incident Timeline", f"{len(result.timeline)} events"),
+                        unsafe_allow_html=True)
             
-            st.markdown('<div class="timeline">', unsafe_allow_html=True)
-            for event in result.timeline[:15]:
-                render_timeline_event(event)
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(fragments['timeline'], unsafe_allow_html=True)
         
         # ===== MULTI-AGENT PANEL =====
         if result.multi_agent is not None:
@@ -1178,6 +1762,10 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             
+            if ma.timed_out:
+                names = ", ".join(name.replace('_', ' ').title() for name in ma.timed_out)
+                st.warning(f"⏱️ Timed out: {names} — showing what the other agents found")
+            
             tab1, tab2, tab3 = st.tabs(["🔍 Root Cause", "📊 Impact", "🛠️ Actions"])
             
             with tab1:
@@ -1185,14 +1773,8 @@ def main():
                 if rc.trigger:
                     st.markdown(f"**Trigger:** {rc.trigger}")
                     
-                    if rc.causal_chain:
-                        chain_html = ""
-                        for i, event in enumerate(rc.causal_chain):
-                            is_last = (i == len(rc.causal_chain) - 1)
-                            node_class = "root" if is_last else ""
-                            arrow = "<span class='chain-arrow'>→</span>" if not is_last else ""
-                            chain_html += f"<span class='chain-node {node_class}'>{html.escape(event)}</span>{arrow}"
-                        st.markdown(f"<div class='causal-chain'>{chain_html}</div>", unsafe_allow_html=True)
+                    if fragments['causal_chain']:
+                        st.markdown(fragments['causal_chain'], unsafe_allow_html=True)
                     
                     if rc.confidence:
                         st.progress(rc.confidence / 100, text=f"Confidence: {rc.confidence}%")
@@ -1207,9 +1789,7 @@ def main():
                 col_a, col_b = st.columns(2)
                 with col_a:
                     if imp.affected_systems:
-                        st.markdown("**Affected Systems**")
-                        for s in imp.affected_systems:
-                            st.markdown(f"• {s}")
+                        st.markdown("  \n".join(["**Affected Systems**", *(f"• {s}" for s in imp.affected_systems)]))
                     if imp.estimated_duration:
                         st.markdown(f"**Duration:** {imp.estimated_duration}")
                 with col_b:
@@ -1223,20 +1803,18 @@ def main():
             
             with tab3:
                 act = ma.actions
-                if act.immediate:
-                    st.markdown("### 🔴 Immediate — Do NOW")
-                    for i, step in enumerate(act.immediate, 1):
-                        st.markdown(f"{i}. {step}")
-                
-                if act.short_term:
-                    st.markdown("### 🟡 Short-Term — Next 1-2 hours")
-                    for i, step in enumerate(act.short_term, 1):
-                        st.markdown(f"{i}. {step}")
-                
-                if act.preventive:
-                    st.markdown("### 🟢 Preventive — After incident")
-                    for i, step in enumerate(act.preventive, 1):
-                        st.markdown(f"{i}. {step}")
+                # Headings and their steps go out as one markdown block
+                action_sections = [
+                    heading + "\n\n" + "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+                    for heading, steps in (
+                        ("### 🔴 Immediate — Do NOW", act.immediate),
+                        ("### 🟡 Short-Term — Next 1-2 hours", act.short_term),
+                        ("### 🟢 Preventive — After incident", act.preventive),
+                    )
+                    if steps
+                ]
+                if action_sections:
+                    st.markdown("\n\n".join(action_sections))
                 
                 if act.rollback_plan:
                     st.markdown(f"**🔙 Rollback Plan:** {act.rollback_plan}")
@@ -1249,8 +1827,7 @@ def main():
                                      if c.strip() and 'no conflicts' not in c.lower()]
                     if real_conflicts:
                         st.error(f"🔴 **Factual Conflicts:** {len(real_conflicts)} detected")
-                        for c in real_conflicts:
-                            st.markdown(f"• {c}")
+                        st.markdown("  \n".join(f"• {c}" for c in real_conflicts))
                 
                 if cons.recommendation:
                     st.info(f"💡 **Recommendation:** {cons.recommendation}")
@@ -1261,18 +1838,28 @@ def main():
         
         sanitized_text = result.sanitization.sanitized_text if result.sanitization else log_content
         redaction_info = ""
+        redaction_breakdown = ""
         if result.sanitization and result.sanitization.was_sanitized:
-            total = len(result.sanitization.audit_trail) + len(result.sanitization.llm_findings)
+            san = result.sanitization
+            total = len(san.audit_trail) + len(san.llm_findings)
             redaction_info = f" • {total} item(s) redacted"
+            counts = Counter(item.pattern_type for item in san.audit_trail)
+            if san.llm_findings:
+                counts["layer 2 (LLM)"] = len(san.llm_findings)
+            redaction_breakdown = " • ".join(f"{ptype}: {n}" for ptype, n in sorted(counts.items()))
         
         with st.expander(f"📋 Sanitized Log{redaction_info}"):
-            st.markdown(f"""
-            <div style="background: var(--bg-secondary); padding: 1rem; border-radius: 10px; 
-                        max-height: 400px; overflow-y: auto; font-family: 'JetBrains Mono', monospace; 
-                        font-size: 0.8125rem; line-height: 1.6; border: 1px solid var(--border-subtle);">
-                {highlight_errors(sanitized_text).replace(chr(10), "<br>")}
-            </div>
-            """, unsafe_allow_html=True)
+            if redaction_breakdown:
+                st.caption(f"🔒 Redacted — {redaction_breakdown}")
+            line_count = sanitized_text.count('\n') + 1
+            show_full = line_count <= _SANITIZED_TAIL_LINES or st.toggle(
+                f"Show full log ({line_count:,} lines)", key="sanitized_show_full")
+            shown_text = sanitized_text if show_full else log_tail(sanitized_text, _SANITIZED_TAIL_LINES)
+            st.markdown(_SANITIZED_LOG_TMPL.format(body=highlight_errors(shown_text)), unsafe_allow_html=True)
+            if show_full and line_count > _HIGHLIGHT_MAX_LINES:
+                # The highlighted view skips the middle of huge logs; the grid virtualizes rows client-side
+                st.caption("Full log (scrollable)")
+                st.dataframe({"line": log_lines(sanitized_text)}, height=300, use_container_width=True)
         
         with st.expander("⚙️ Technical Details"):
             col1, col2 = st.columns(2)
@@ -1300,142 +1887,33 @@ def main():
         
         # Export PDF - FIXED
         with col1:
-            if REPORTLAB_AVAILABLE:
-                try:
-                    buffer = io.BytesIO()
-                    doc = SimpleDocTemplate(buffer, pagesize=letter,
-                                        rightMargin=72, leftMargin=72,
-                                        topMargin=72, bottomMargin=18)
-                    
-                    styles = getSampleStyleSheet()
-                    story = []
-                    
-                    # Title
-                    title_style = ParagraphStyle(
-                        'CustomTitle',
-                        parent=styles['Heading1'],
-                        fontSize=24,
-                        textColor=colors.HexColor('#6366f1'),
-                        spaceAfter=30
-                    )
-                    story.append(Paragraph("LogGuard Incident Report", title_style))
-                    story.append(Spacer(1, 12))
-                    
-                    # Metadata
-                    meta_data = [
-                        ['Incident ID:', f"INC-{int(time.time())}"],
-                        ['System:', result.system],
-                        ['Severity:', result.severity],
-                        ['Component:', result.affected_component or "N/A"],
-                        ['Confidence:', f"{result.confidence:.0%}"],
-                        ['Analysis Time:', f"{elapsed:.2f}s"]
-                    ]
-                    meta_table = Table(meta_data, colWidths=[2*inch, 4*inch])
-                    meta_table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-                        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, -1), 10),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-                    ]))
-                    story.append(meta_table)
-                    story.append(Spacer(1, 20))
-                    
-                    # Analysis Summary
-                    story.append(Paragraph("Analysis Summary", styles['Heading2']))
-                    analysis_text = result.analysis if not result.multi_agent else (
-                        result.multi_agent.root_cause.trigger if result.multi_agent.root_cause else result.analysis
-                    )
-                    story.append(Paragraph(analysis_text, styles['BodyText']))
-                    story.append(Spacer(1, 12))
-                    
-                    # Contacts
-                    if result.contacts:
-                        story.append(Paragraph("Key Contacts", styles['Heading2']))
-                        for contact in result.contacts:
-                            contact_info = f"<b>{contact.name}</b> - {contact.role}<br/>" \
-                                        f"Email: {contact.email}<br/>" \
-                                        f"Phone: {contact.phone or 'N/A'}"
-                            if contact.escalation_contact:
-                                contact_info += f"<br/>Escalate to: {contact.escalation_contact}"
-                            story.append(Paragraph(contact_info, styles['BodyText']))
-                            story.append(Spacer(1, 6))
-                        story.append(Spacer(1, 12))
-                    
-                    # Solutions
-                    if result.solutions:
-                        story.append(Paragraph("Recommended Solutions", styles['Heading2']))
-                        for i, sol in enumerate(result.solutions, 1):
-                            story.append(Paragraph(f"<b>Solution {i}: {sol.title}</b>", styles['Heading3']))
-                            story.append(Paragraph(f"Owner: {sol.owner.name} | Duration: {sol.duration}", styles['Italic']))
-                            for step in sol.steps:
-                                story.append(Paragraph(f"• {step}", styles['BodyText']))
-                            story.append(Spacer(1, 6))
-                    
-                    # Timeline
-                    if result.timeline:
-                        story.append(Paragraph("Event Timeline", styles['Heading2']))
-                        timeline_data = [['Time', 'Component', 'Event']]
-                        for event in result.timeline[:10]:
-                            timeline_data.append([
-                                event['timestamp'],
-                                event['component'],
-                                event['message'][:100] + '...' if len(event['message']) > 100 else event['message']
-                            ])
-                        timeline_table = Table(timeline_data, colWidths=[1.5*inch, 1.2*inch, 3.3*inch])
-                        timeline_table.setStyle(TableStyle([
-                            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-                            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                            ('FONTSIZE', (0, 0), (-1, 0), 10),
-                            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                            ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                        ]))
-                        story.append(timeline_table)
-                    
-                    doc.build(story)
-                    
-                    st.download_button(
-                        "📥 Export PDF", 
-                        buffer.getvalue(),
-                        f"incident_report_{result.system}_{int(time.time())}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
-                except Exception as e:
-                    st.error(f"PDF Error: {str(e)}")
+            if reportlab_available():
+                # The PDF is built when the button is clicked; build errors are logged by deferred_pdf_report
+                st.download_button(
+                    "📥 Export PDF", 
+                    functools.partial(deferred_pdf_report, result_key, elapsed, result),
+                    f"incident_report_{result.system}_{int(time.time())}.pdf",
+                    mime="application/pdf",
+                    use_container_width=True
+                )
             else:
                 st.button("📥 Export PDF", disabled=True, help="Install reportlab: pip install reportlab")
         
         # Copy for Slack - FIXED with toast notification
         with col2:
-            slack_text = format_for_slack(result)
-            
             # Use native Streamlit button with session state for click tracking
             if st.button("📋 Copy for Slack", use_container_width=True, key="copy_slack"):
-                # Copy to clipboard using Streamlit's built-in method
-                st.write(f"""
-                <script>
-                    navigator.clipboard.writeText({json.dumps(slack_text)});
-                </script>
-                """, unsafe_allow_html=True)
+                _, slack_json = slack_payload(result_key, result)
+                # Copy to clipboard (script-only HTML takes no space in the layout)
+                st.html(_CLIPBOARD_SCRIPT.replace("{SLACK_JSON}", slack_json), unsafe_allow_javascript=True)
                 
                 # Show native toast notification
                 st.toast("✅ Copied to clipboard!", icon="📋")
-                
-                # Small delay to show the toast
-                time.sleep(0.1)
         
         # New analysis button
         with col3:
             if st.button("🔄 New Analysis", type="primary", use_container_width=True):
-                for key in list(st.session_state.keys()):
-                    del st.session_state[key]
+                st.session_state.clear()
                 st.rerun()
 
 
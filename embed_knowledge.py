@@ -9,12 +9,48 @@ import chromadb
 from pathlib import Path
 import logging
 import hashlib
+import json
 from datetime import datetime
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional: embed with sentence-transformers (batched, uses a GPU if present)
+# instead of Chroma's built-in embedding function
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Same model as Chroma's default embedding function, so the query side
+# (which embeds query_texts with Chroma's default) stays compatible
+_EMBED_MODEL = "all-MiniLM-L6-v2"
+_ENCODE_BATCH_SIZE = 64
+
+# Sidecar in the DB directory mapping each KB file to the digest it was embedded from
+_FILE_HASHES_NAME = "_file_hashes.json"
+
+# Patterns run once per file or per chunk, so compile them up front
+_SECTION_SPLIT_RE = re.compile(r'\n(#{2,4}\s+[^\n]+)\n')
+_H1_RE = re.compile(r'#\s+([^\n]+)')
+_CONTACT_NAME_RE = re.compile(r'####\s+([^-\n]+?)\s*-\s*([^\n]+)')
+_EMAIL_RE = re.compile(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})')
+_INCIDENT_ID_RE = re.compile(r'#\d{4}-\d{4}')
+_OWNER_RE = re.compile(r'\*\*Owner\*\*:\s*([^\n(]+)')
+_SYSTEM_RE = re.compile(r'Server_[ABC]')
+
+# Severity keywords by tier, found in one pass; the highest tier present wins
+_SEVERITY_WORDS = {
+    'CRITICAL': 'CRITICAL', 'P1': 'CRITICAL', 'Critical': 'CRITICAL',
+    'ERROR': 'HIGH', 'P2': 'HIGH', 'High': 'HIGH',
+    'WARNING': 'MEDIUM', 'P3': 'MEDIUM', 'Medium': 'MEDIUM',
+}
+_SEVERITY_WORD_RE = re.compile('|'.join(_SEVERITY_WORDS))
+_SEVERITY_ORDER = ('CRITICAL', 'HIGH', 'MEDIUM')
+
 
 class IntelligentChunker:
     """Smart document chunking that preserves context"""
@@ -27,54 +63,44 @@ class IntelligentChunker:
         """Chunk by markdown sections while preserving headers"""
         chunks = []
         
-        # Split by level 2-4 headers (## ### ####)
-        sections = re.split(r'\n(#{2,4}\s+[^\n]+)\n', text)
-        
         current_h1 = ""
         current_h2 = ""
         
         # Extract H1 if exists
-        h1_match = re.match(r'#\s+([^\n]+)', text)
+        h1_match = _H1_RE.match(text)
         if h1_match:
             current_h1 = h1_match.group(1).strip()
         
-        i = 0
-        while i < len(sections):
-            # Check if this is a header
-            if i > 0 and sections[i].startswith('#'):
-                header = sections[i]
-                content = sections[i + 1] if i + 1 < len(sections) else ""
-                
-                # Update context headers
-                if header.startswith('##') and not header.startswith('###'):
-                    current_h2 = header.replace('#', '').strip()
-                
-                # Build chunk with context
-                chunk_text = f"{header}\n{content}"
-                
-                # Add parent context if available
-                context_prefix = ""
-                if current_h1:
-                    context_prefix = f"# {current_h1}\n"
-                if current_h2 and not header.startswith('##'):
-                    context_prefix += f"## {current_h2}\n"
-                
-                full_chunk = context_prefix + chunk_text
-                
-                # If chunk too large, split it
-                if len(full_chunk) > self.chunk_size:
-                    sub_chunks = self._split_large_chunk(full_chunk, header)
-                    chunks.extend(sub_chunks)
-                else:
-                    chunks.append({
-                        'content': full_chunk.strip(),
-                        'source': source,
-                        'section': header.strip('#').strip()
-                    })
-                
-                i += 2
+        # Split by level 2-4 headers (## ### ####): [preamble, header, content, header, content, ...]
+        sections = _SECTION_SPLIT_RE.split(text)
+        
+        for header, content in zip(sections[1::2], sections[2::2]):
+            # Update context headers
+            if header.startswith('##') and not header.startswith('###'):
+                current_h2 = header.replace('#', '').strip()
+            
+            # Build chunk with context
+            chunk_text = f"{header}\n{content}"
+            
+            # Add parent context if available
+            context_prefix = ""
+            if current_h1:
+                context_prefix = f"# {current_h1}\n"
+            if current_h2 and not header.startswith('##'):
+                context_prefix += f"## {current_h2}\n"
+            
+            full_chunk = context_prefix + chunk_text
+            
+            # If chunk too large, split it
+            if len(full_chunk) > self.chunk_size:
+                sub_chunks = self._split_large_chunk(full_chunk, header)
+                chunks.extend(sub_chunks)
             else:
-                i += 1
+                chunks.append({
+                    'content': full_chunk.strip(),
+                    'source': source,
+                    'section': header.strip('#').strip()
+                })
         
         return chunks if chunks else [{'content': text[:self.chunk_size], 'source': source, 'section': 'main'}]
     
@@ -83,21 +109,26 @@ class IntelligentChunker:
         chunks = []
         paragraphs = text.split('\n\n')
         
-        current = ""
+        # Collect paragraphs in a list instead of growing one string; current_len
+        # counts each paragraph plus its "\n\n" separator
+        current = []
+        current_len = 0
         for para in paragraphs:
-            if len(current) + len(para) < self.chunk_size:
-                current += para + "\n\n"
+            if current_len + len(para) < self.chunk_size:
+                current.append(para)
+                current_len += len(para) + 2
             else:
                 if current:
                     chunks.append({
-                        'content': current.strip(),
+                        'content': "\n\n".join(current).strip(),
                         'section': header.strip('#').strip()
                     })
-                current = para + "\n\n"
+                current = [para]
+                current_len = len(para) + 2
         
         if current:
             chunks.append({
-                'content': current.strip(),
+                'content': "\n\n".join(current).strip(),
                 'section': header.strip('#').strip()
             })
         
@@ -127,39 +158,35 @@ class EnhancedMetadataExtractor:
             meta['doc_type'] = 'servers'
         
         # Extract contact info (if exists in chunk)
-        name_match = re.search(r'####\s+([^-\n]+?)\s*-\s*([^\n]+)', text)
+        name_match = _CONTACT_NAME_RE.search(text)
         if name_match:
             meta['contact_name'] = name_match.group(1).strip()
             meta['contact_role'] = name_match.group(2).strip()
         
         # Extract email
-        email_match = re.search(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', text)
+        email_match = _EMAIL_RE.search(text)
         if email_match:
             meta['contact_email'] = email_match.group(1)
         
         # Extract system references
-        systems = []
-        for system in ['Server_A', 'Server_B', 'Server_C']:
-            if system in text:
-                systems.append(system)
+        systems = sorted(set(_SYSTEM_RE.findall(text)))
         if systems:
             meta['systems'] = ','.join(systems)
         
         # Extract severity
-        if any(word in text for word in ['CRITICAL', 'P1', 'Critical']):
-            meta['severity'] = 'CRITICAL'
-        elif any(word in text for word in ['ERROR', 'P2', 'High']):
-            meta['severity'] = 'HIGH'
-        elif any(word in text for word in ['WARNING', 'P3', 'Medium']):
-            meta['severity'] = 'MEDIUM'
+        tiers = {_SEVERITY_WORDS[word] for word in _SEVERITY_WORD_RE.findall(text)}
+        for severity in _SEVERITY_ORDER:
+            if severity in tiers:
+                meta['severity'] = severity
+                break
         
         # Extract incident IDs
-        incidents = re.findall(r'#\d{4}-\d{4}', text)
+        incidents = _INCIDENT_ID_RE.findall(text)
         if incidents:
             meta['related_incidents'] = ','.join(list(set(incidents))[:5])
         
         # Extract owner for runbooks
-        owner_match = re.search(r'\*\*Owner\*\*:\s*([^\n(]+)', text)
+        owner_match = _OWNER_RE.search(text)
         if owner_match:
             meta['owner'] = owner_match.group(1).strip()
         
@@ -169,12 +196,16 @@ class EnhancedMetadataExtractor:
 class KnowledgeBaseBuilder:
     """Build optimized KB"""
     
-    def __init__(self, db_path: str = "./chroma_db"):
+    def __init__(self, db_path: str = "./chroma_db", batch_size: int = 250):
         self.db_path = db_path
+        self.batch_size = batch_size  # chunks per collection.add call
         self.client = chromadb.PersistentClient(path=db_path)
         self.chunker = IntelligentChunker(chunk_size=800, overlap=100)
         self.extractor = EnhancedMetadataExtractor()
+        self.encoder = SentenceTransformer(_EMBED_MODEL) if SENTENCE_TRANSFORMERS_AVAILABLE else None
         logger.info(f"✅ ChromaDB initialized: {db_path}")
+        if self.encoder is not None:
+            logger.info(f"⚡ Embedding with sentence-transformers on {self.encoder.device}")
     
     def create_collection(self, name: str):
         """Create fresh collection"""
@@ -191,10 +222,97 @@ class KnowledgeBaseBuilder:
         logger.info(f"✅ Created collection: {name}")
         return collection
     
-    def load_and_embed(self, knowledge_dir: str, collection_name: str = "company_knowledge"):
-        """Load and embed documents"""
+    def _process_file(self, md_file: Path):
+        """Read, chunk and tag one file; returns (id, document, metadata) entries, or None on error"""
+        logger.info(f"  Processing: {md_file.name}")
+        
+        try:
+            content = md_file.read_text(encoding='utf-8')
+            
+            # Chunk intelligently
+            chunks = self.chunker.chunk_by_sections(content, str(md_file))
+            
+            entries = []
+            seen = set()  # identical chunks within the file are embedded once
+            for chunk in chunks:
+                digest = hashlib.blake2b(chunk['content'].encode('utf-8'), digest_size=16).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                
+                # Extract metadata
+                metadata = self.extractor.extract_metadata(chunk['content'], md_file.name)
+                metadata['source'] = chunk.get('source', str(md_file))
+                metadata['section'] = chunk.get('section', 'main')
+                
+                # Clean metadata (ChromaDB requirement)
+                clean_meta = {}
+                for k, v in metadata.items():
+                    if v is None or v == "":
+                        continue
+                    clean_meta[k] = str(v)
+                
+                # IDs are per file, so one file's chunks can be replaced without renumbering the rest
+                entries.append((f"{md_file.stem}_{len(entries)}", chunk['content'], clean_meta))
+            
+            skipped = f" ({len(chunks) - len(entries)} duplicates skipped)" if len(entries) < len(chunks) else ""
+            logger.info(f"    ✓ {md_file.name}: {len(entries)} chunks{skipped}")
+            return entries
         
-        collection = self.create_collection(collection_name)
+        except Exception as e:
+            logger.error(f"    ❌ Error in {md_file.name}: {e}")
+            return None
+    
+    def _add_batch(self, collection, entries: list) -> bool:
+        """Embed one batch of (id, document, metadata) entries; returns False if the batch failed"""
+        ids, docs, metas = (list(column) for column in zip(*entries))
+        try:
+            embeddings = None
+            if self.encoder is not None:
+                # Normalized like Chroma's default, so distances match query embeddings
+                embeddings = self.encoder.encode(
+                    docs, batch_size=_ENCODE_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True
+                ).tolist()
+            collection.add(
+                documents=docs,
+                embeddings=embeddings,
+                metadatas=metas,
+                ids=ids
+            )
+            logger.info(f"  ✓ Batch {ids[0]}..{ids[-1]}: {len(docs)} chunks")
+            return True
+        except Exception as e:
+            logger.error(f"  ❌ Batch failed: {e}")
+            return False
+    
+    def _load_file_hashes(self, collection_name: str) -> dict:
+        """File digests recorded by the last successful embed of this collection"""
+        try:
+            with open(os.path.join(self.db_path, _FILE_HASHES_NAME), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get('collection') != collection_name:
+            return {}
+        return state.get('files', {})
+    
+    def _save_file_hashes(self, collection_name: str, file_hashes: dict):
+        """Record file digests atomically (write a temp file, then rename it over the old one)"""
+        path = os.path.join(self.db_path, _FILE_HASHES_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'collection': collection_name, 'files': file_hashes}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    
+    def _clear_file_hashes(self):
+        """Forget recorded digests so the next run rebuilds from scratch"""
+        try:
+            os.remove(os.path.join(self.db_path, _FILE_HASHES_NAME))
+        except OSError:
+            pass
+    
+    def load_and_embed(self, knowledge_dir: str, collection_name: str = "company_knowledge"):
+        """Load and embed documents, re-embedding only files that changed since the last run"""
         
         kb_path = Path(knowledge_dir)
         if not kb_path.exists():
@@ -208,62 +326,61 @@ class KnowledgeBaseBuilder:
         
         logger.info(f"📚 Found {len(md_files)} files")
         
-        all_docs = []
-        all_metas = []
-        all_ids = []
-        doc_id = 0
+        file_hashes = {
+            md_file.name: hashlib.blake2b(md_file.read_bytes(), digest_size=16).hexdigest()
+            for md_file in md_files
+        }
+        previous = self._load_file_hashes(collection_name)
         
-        for md_file in md_files:
-            logger.info(f"  Processing: {md_file.name}")
-            
+        collection = None
+        if previous:
             try:
-                content = md_file.read_text(encoding='utf-8')
-                
-                # Chunk intelligently
-                chunks = self.chunker.chunk_by_sections(content, str(md_file))
-                
-                for chunk in chunks:
-                    # Extract metadata
-                    metadata = self.extractor.extract_metadata(chunk['content'], md_file.name)
-                    metadata['source'] = chunk.get('source', str(md_file))
-                    metadata['section'] = chunk.get('section', 'main')
-                    
-                    # Clean metadata (ChromaDB requirement)
-                    clean_meta = {}
-                    for k, v in metadata.items():
-                        if v is None or v == "":
-                            continue
-                        clean_meta[k] = str(v)
-                    
-                    all_docs.append(chunk['content'])
-                    all_metas.append(clean_meta)
-                    all_ids.append(f"doc_{doc_id}")
-                    doc_id += 1
-                
-                logger.info(f"    ✓ {len(chunks)} chunks")
+                collection = self.client.get_collection(collection_name)
+            except Exception:
+                collection = None
+        
+        if collection is None:
+            # No usable record of the last run: rebuild everything
+            collection = self.create_collection(collection_name)
+            changed = md_files
+        else:
+            changed = [f for f in md_files if previous.get(f.name) != file_hashes[f.name]]
+            stale = [f.name for f in changed if f.name in previous]
+            stale += [name for name in previous if name not in file_hashes]
+            for name in stale:
+                collection.delete(where={'file': name})
+            logger.info(f"⏭️ {len(md_files) - len(changed)} unchanged files skipped, "
+                        f"{len(changed)} to embed, {len(stale)} replaced or removed")
+        
+        # Record nothing until this run succeeds; a failed run then rebuilds next time
+        self._clear_file_hashes()
+        ok = True
+        
+        # Files are read, chunked and tagged on worker threads while the main thread
+        # embeds each full batch
+        if changed:
+            logger.info("\n🚀 Embedding chunks as files are processed...")
+            batch_size = self.batch_size
+            pending = []  # (id, document, metadata) entries not yet embedded
             
-            except Exception as e:
-                logger.error(f"    ❌ Error: {e}")
-                continue
-        
-        # Embed in batches
-        logger.info(f"\n🚀 Embedding {len(all_docs)} chunks...")
-        batch_size = 100
-        
-        for i in range(0, len(all_docs), batch_size):
-            batch_docs = all_docs[i:i+batch_size]
-            batch_metas = all_metas[i:i+batch_size]
-            batch_ids = all_ids[i:i+batch_size]
+            with ThreadPoolExecutor(max_workers=min(len(changed), os.cpu_count() or 1)) as executor:
+                for processed in executor.map(self._process_file, changed):
+                    if processed is None:
+                        ok = False
+                        continue
+                    pending.extend(processed)
+                    
+                    while len(pending) >= batch_size:
+                        ok &= self._add_batch(collection, pending[:batch_size])
+                        del pending[:batch_size]
             
-            try:
-                collection.add(
-                    documents=batch_docs,
-                    metadatas=batch_metas,
-                    ids=batch_ids
-                )
-                logger.info(f"  ✓ Batch {i//batch_size + 1}: {min(i+batch_size, len(all_docs))}/{len(all_docs)}")
-            except Exception as e:
-                logger.error(f"  ❌ Batch failed: {e}")
+            if pending:
+                ok &= self._add_batch(collection, pending)
+        
+        if ok:
+            self._save_file_hashes(collection_name, file_hashes)
+        else:
+            logger.warning("⚠️ Some files or batches failed; the next run will rebuild the collection")
         
         final_count = collection.count()
         logger.info(f"✅ Embedded {final_count} documents")
@@ -285,17 +402,18 @@ class KnowledgeBaseBuilder:
             ("security incident CVE", "Should find James Wilson + security runbook")
         ]
         
-        for query, expected in tests:
-            results = collection.query(
-                query_texts=[query],
-                n_results=3,
-                include=["documents", "metadatas", "distances"]
-            )
-            
-            if results['documents'] and results['documents'][0]:
-                doc = results['documents'][0][0]
-                meta = results['metadatas'][0][0]
-                dist = results['distances'][0][0] if 'distances' in results else 0
+        # One query call for all test queries: a single embedding pass and index traversal
+        results = collection.query(
+            query_texts=[query for query, _ in tests],
+            n_results=3,
+            include=["documents", "metadatas", "distances"]
+        )
+        distances = results.get('distances') or [[]] * len(tests)
+        
+        for (query, expected), docs, metas, dists in zip(tests, results['documents'], results['metadatas'], distances):
+            if docs:
+                meta = metas[0]
+                dist = dists[0] if dists else 0
                 
                 contact = meta.get('contact_name', 'N/A')
                 doc_type = meta.get('doc_type', 'unknown')
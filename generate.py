@@ -6,30 +6,49 @@ Takes your existing incidents.md and ADDS missing information without deleting a
 
 import re
 import random
+import functools
 from datetime import datetime
 
+# Patterns are applied to every incident block, so compile them once
+_INCIDENT_ID_RE = re.compile(r'## Incident (#\d{4}-\d{4})')
+_INCIDENT_HEADER_RE = re.compile(r'## Incident #\d{4}-\d{4}')
+_FIELD_KEYS = {
+    field: field.lower().replace(' ', '_')
+    for field in ['Date', 'System', 'Severity', 'Type', 'Resolved By', 'Resolution Time', 'Users Affected']
+}
+# One scan picks up every "**Field**: value" line, revenue included
+_FIELDS_RE = re.compile(r'\*\*(' + '|'.join([*_FIELD_KEYS, 'Revenue Impact']) + r')\*\*:\s*(.+)')
+_REVENUE_VALUE_RE = re.compile(r'\$?([\d,]+)')
+_DESCRIPTION_RE = re.compile(r'### Description\s+(.+?)(?=###|$)', re.DOTALL)
+_ROOT_CAUSE_RE = re.compile(r'Investigation revealed([^.]*)')
+
 def parse_incident(incident_text):
     """Parse an incident block into structured data"""
+    # A fresh dict per call, so callers can't modify the cached result
+    return dict(_parse_incident(incident_text))
+
+# Incident blocks repeat across runs of the same file and in templated incidents
+@functools.lru_cache(maxsize=4096)
+def _parse_incident(incident_text):
     data = {}
     
     # Extract incident number
-    match = re.search(r'## Incident (#\d{4}-\d{4})', incident_text)
+    match = _INCIDENT_ID_RE.search(incident_text)
     if match:
         data['id'] = match.group(1)
     
-    # Extract existing fields
-    for field in ['Date', 'System', 'Severity', 'Type', 'Resolved By', 'Resolution Time', 'Users Affected']:
-        match = re.search(rf'\*\*{field}\*\*:\s*(.+)', incident_text)
-        if match:
-            data[field.lower().replace(' ', '_')] = match.group(1).strip()
-    
-    # Extract revenue impact
-    match = re.search(r'\*\*Revenue Impact\*\*:\s*\$?([\d,]+)', incident_text)
-    if match:
-        data['revenue_impact'] = int(match.group(1).replace(',', ''))
+    # Extract existing fields and revenue impact; the first occurrence of each wins
+    for match in _FIELDS_RE.finditer(incident_text):
+        field, value = match.groups()
+        if field == 'Revenue Impact':
+            revenue = _REVENUE_VALUE_RE.match(value)
+            if revenue and 'revenue_impact' not in data:
+                data['revenue_impact'] = int(revenue.group(1).replace(',', ''))
+        elif _FIELD_KEYS[field] not in data:
+            data[_FIELD_KEYS[field]] = value.strip()
     
     # Extract description
-    desc_match = re.search(r'### Description\s+(.+?)(?=###|$)', incident_text, re.DOTALL)
+    desc_match = _DESCRIPTION_RE.search(incident_text)
     if desc_match:
         data['description'] = desc_match.group(1).strip()
     
@@ -37,10 +56,14 @@ def parse_incident(incident_text):
 
 def calculate_financial_details(incident_data):
     """Calculate detailed financial impact based on existing revenue impact"""
-    revenue_impact = incident_data.get('revenue_impact', 0)
-    resolution_time = int(incident_data.get('resolution_time', '60').split()[0])
-    severity = incident_data.get('severity', 'MEDIUM')
-    
+    return dict(_financial_details(
+        incident_data.get('revenue_impact', 0),
+        int(incident_data.get('resolution_time', '60').split()[0]),
+        incident_data.get('severity', 'MEDIUM'),
+    ))
+
+@functools.lru_cache(maxsize=4096)
+def _financial_details(revenue_impact, resolution_time, severity):
     # Calculate engineering costs based on resolution time and severity
     if severity == 'CRITICAL':
         primary_rate = 250  # Senior engineer
@@ -72,47 +95,77 @@ def calculate_financial_details(incident_data):
         'engineering_hours': round(hours, 1)
     }
 
+# Engineer -> team, and incident type -> usual assisting engineer
+_TEAM_MAPPING = {
+    'Sarah Chen': 'Database',
+    'Michael O\'Brien': 'Database',
+    'Raj Patel': 'Database',
+    'Mike Rodriguez': 'Platform',
+    'Priya Patel': 'Platform',
+    'Alex Kim': 'Platform',
+    'Tom Bradley': 'Infrastructure',
+    'Carlos Mendez': 'Infrastructure',
+    'Jessica Wu': 'Infrastructure',
+    'Dr. James Wilson': 'Security',
+    'Rachel Thompson': 'Security',
+    'Emma Walsh': 'Application',
+    'Olivia Johnson': 'Frontend',
+    'Dr. Richard Lee': 'Data',
+    'Chris Anderson': 'Data',
+    'Lisa Park': 'Performance'
+}
+
+_TYPE_ASSISTANTS = {
+    'database_connection_pool': 'Tom Bradley (Infrastructure)',
+    'memory_leak': 'Lisa Park (Performance)',
+    'disk_full': 'Carlos Mendez (Infrastructure)',
+    'rate_limit_exceeded': 'Dr. James Wilson (Security)',
+    'ssl_certificate_expiry': 'Tom Bradley (Infrastructure)',
+    'cache_stampede': 'Mike Rodriguez (Platform)',
+    'authentication_failure': 'Rachel Thompson (Security)',
+    'payment_gateway_timeout': 'Emma Walsh (Application)'
+}
+
 def get_team_for_engineer(engineer_name):
     """Map engineer names to teams"""
-    team_mapping = {
-        'Sarah Chen': 'Database',
-        'Michael O\'Brien': 'Database',
-        'Raj Patel': 'Database',
-        'Mike Rodriguez': 'Platform',
-        'Priya Patel': 'Platform',
-        'Alex Kim': 'Platform',
-        'Tom Bradley': 'Infrastructure',
-        'Carlos Mendez': 'Infrastructure',
-        'Jessica Wu': 'Infrastructure',
-        'Dr. James Wilson': 'Security',
-        'Rachel Thompson': 'Security',
-        'Emma Walsh': 'Application',
-        'Olivia Johnson': 'Frontend',
-        'Dr. Richard Lee': 'Data',
-        'Chris Anderson': 'Data',
-        'Lisa Park': 'Performance'
-    }
-    return team_mapping.get(engineer_name, 'Engineering')
+    return _TEAM_MAPPING.get(engineer_name, 'Engineering')
 
 def get_assistant_for_type(incident_type, primary_engineer):
     """Determine likely assistant based on incident type"""
-    type_assistants = {
-        'database_connection_pool': 'Tom Bradley (Infrastructure)',
-        'memory_leak': 'Lisa Park (Performance)',
-        'disk_full': 'Carlos Mendez (Infrastructure)',
-        'rate_limit_exceeded': 'Dr. James Wilson (Security)',
-        'ssl_certificate_expiry': 'Tom Bradley (Infrastructure)',
-        'cache_stampede': 'Mike Rodriguez (Platform)',
-        'authentication_failure': 'Rachel Thompson (Security)',
-        'payment_gateway_timeout': 'Emma Walsh (Application)'
-    }
-    
     # Don't assist yourself
-    assistant = type_assistants.get(incident_type, 'Engineering Team')
+    assistant = _TYPE_ASSISTANTS.get(incident_type, 'Engineering Team')
     if primary_engineer in assistant:
         return None
     return assistant
 
+# Sections appended to each incident, filled by enhance_incident
+_FINANCIAL_SECTION_TMPL = """
+### Financial Impact
+
+- **Direct Loss**: ${direct_loss:,}
+  - Lost revenue during incident
+  - Customer-facing service degradation
+- **Indirect Loss**: ${indirect_loss:,}
+  - Engineering time: {engineering_hours} hours
+  - {resolved_by}: ${primary_cost:,}{assistant_cost_line}
+- **Total Cost**: ${total_cost:,}
+"""
+
+_RESOLUTION_SECTION_TMPL = """
+### Detailed Resolution
+
+**Timeline:**
+1. **{detection_time}** - Detected via monitoring alert
+2. **{start_investigation}** - {resolved_by} ({team} Team) began investigation
+3. **{root_cause_found}** - Identified root cause: {root_cause}
+4. **{fix_applied}** - Applied fix and deployed{assistant_step}
+6. **{recovery_verified}** - Verified recovery and system stability
+7. **Post-incident** - Post-mortem scheduled
+
+**Resolved By**: {resolved_by} ({team} Team){assisted_by_line}
+**Total Duration**: {resolution_time} minutes
+"""
+
 def enhance_incident(incident_text):
     """Add missing financial and timeline information to an incident"""
     
@@ -131,56 +184,32 @@ def enhance_incident(incident_text):
     # Get assistant
     assistant = get_assistant_for_type(data.get('type', ''), resolved_by)
     
-    # Build financial impact section
-    financial_section = f"""
-### Financial Impact
-
-- **Direct Loss**: ${financial['direct_loss']:,}
-  - Lost revenue during incident
-  - Customer-facing service degradation
-- **Indirect Loss**: ${financial['indirect_loss']:,}
-  - Engineering time: {financial['engineering_hours']} hours
-  - {resolved_by}: ${int(financial['indirect_loss'] * 0.7):,}"""
-    
-    if assistant:
-        financial_section += f"\n  - {assistant}: ${int(financial['indirect_loss'] * 0.3):,}"
-    
-    financial_section += f"""
-- **Total Cost**: ${financial['total_cost']:,}
-"""
-    
-    # Build detailed resolution section with timeline
+    # Timeline offsets scale with the resolution time
     resolution_time = int(data.get('resolution_time', '60').split()[0])
-    detection_time = "00:00"
-    start_investigation = f"{int(resolution_time * 0.05):02d}:00"
-    root_cause_found = f"{int(resolution_time * 0.4):02d}:00"
     fix_applied = f"{int(resolution_time * 0.7):02d}:00"
-    recovery_verified = f"{resolution_time:02d}:00"
     
-    enhanced_resolution = f"""
-### Detailed Resolution
-
-**Timeline:**
-1. **{detection_time}** - Detected via monitoring alert
-2. **{start_investigation}** - {resolved_by} ({team} Team) began investigation
-3. **{root_cause_found}** - Identified root cause: {data.get('description', '').split('Investigation revealed')[1].split('.')[0] if 'Investigation revealed' in data.get('description', '') else 'system issue'}
-4. **{fix_applied}** - Applied fix and deployed"""
-    
-    if assistant:
-        enhanced_resolution += f"\n5. **{fix_applied}** - {assistant} provided support"
-    
-    enhanced_resolution += f"""
-6. **{recovery_verified}** - Verified recovery and system stability
-7. **Post-incident** - Post-mortem scheduled
-
-**Resolved By**: {resolved_by} ({team} Team)"""
-    
-    if assistant:
-        enhanced_resolution += f"\n**Assisted By**: {assistant}"
-    
-    enhanced_resolution += f"""
-**Total Duration**: {resolution_time} minutes
-"""
+    # Root cause is the rest of the "Investigation revealed ..." sentence
+    root_cause_match = _ROOT_CAUSE_RE.search(data.get('description', ''))
+    
+    # Fill both section templates from one context; the assistant lines are optional
+    context = {
+        **financial,
+        'resolved_by': resolved_by,
+        'team': team,
+        'primary_cost': int(financial['indirect_loss'] * 0.7),
+        'assistant_cost_line': f"\n  - {assistant}: ${int(financial['indirect_loss'] * 0.3):,}" if assistant else "",
+        'detection_time': "00:00",
+        'start_investigation': f"{int(resolution_time * 0.05):02d}:00",
+        'root_cause_found': f"{int(resolution_time * 0.4):02d}:00",
+        'root_cause': root_cause_match.group(1) if root_cause_match else 'system issue',
+        'fix_applied': fix_applied,
+        'assistant_step': f"\n5. **{fix_applied}** - {assistant} provided support" if assistant else "",
+        'recovery_verified': f"{resolution_time:02d}:00",
+        'assisted_by_line': f"\n**Assisted By**: {assistant}" if assistant else "",
+        'resolution_time': resolution_time,
+    }
+    financial_section = _FINANCIAL_SECTION_TMPL.format_map(context)
+    enhanced_resolution = _RESOLUTION_SECTION_TMPL.format_map(context)
     
     # Insert new sections before the "Related Incidents" line
     if '**Related Incidents**' in incident_text:
@@ -192,38 +221,37 @@ def enhance_incident(incident_text):
         # Just append to the end
         return incident_text.rstrip() + '\n' + financial_section + '\n' + enhanced_resolution + '\n'
 
+def _write_block(out, block, is_incident):
+    """Write one buffered block (enhanced if it is an incident); returns the incident headers written"""
+    text = ''.join(block)
+    if is_incident:
+        text = enhance_incident(text)
+    out.write(text)
+    return len(_INCIDENT_HEADER_RE.findall(text))
+
 def enhance_incidents_file(input_file, output_file):
     """Process entire incidents.md file"""
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Split by incident headers
-    incidents = re.split(r'(## Incident #\d{4}-\d{4})', content)
-    
-    # First part is the header
-    enhanced_content = incidents[0]
-    
-    # Process each incident (they come in pairs: header + content)
-    for i in range(1, len(incidents), 2):
-        if i + 1 < len(incidents):
-            incident_header = incidents[i]
-            incident_content = incidents[i + 1]
-            full_incident = incident_header + incident_content
-            
-            enhanced_incident = enhance_incident(full_incident)
-            enhanced_content += enhanced_incident
-    
-    # Write enhanced version
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(enhanced_content)
+    # Stream the file: buffer one incident at a time (header line up to the next
+    # header) and write it out enhanced, so memory holds a single incident
+    original_count = 0
+    enhanced_count = 0
+    block = []
+    is_incident = False  # the first block is the file header
+    
+    with open(input_file, 'r', encoding='utf-8') as src, \
+            open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out:
+        for line in src:
+            if _INCIDENT_HEADER_RE.match(line):
+                enhanced_count += _write_block(out, block, is_incident)
+                block = []
+                is_incident = True
+                original_count += 1
+            block.append(line)
+        enhanced_count += _write_block(out, block, is_incident)
     
     print(f"✅ Enhanced incidents written to {output_file}")
     
-    # Count incidents
-    original_count = len(re.findall(r'## Incident #\d{4}-\d{4}', content))
-    enhanced_count = len(re.findall(r'## Incident #\d{4}-\d{4}', enhanced_content))
-    
     print(f"📊 Original incidents: {original_count}")
     print(f"📊 Enhanced incidents: {enhanced_count}")
     print(f"📊 Data preserved: {original_count == enhanced_count}")
@@ -12,9 +12,9 @@ import time
 import logging
 import re
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 from dataclasses import dataclass, field
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +88,30 @@ class MultiAgentResult:
     total_time: float = 0.0
     agent_times: Dict[str, float] = field(default_factory=dict)
     errors: list = field(default_factory=list)
+    timed_out: list = field(default_factory=list)  # agent keys that missed their AGENT_TIMEOUTS deadline
+
+
+# Per-agent deadlines in seconds. Generous enough for a local Ollama model that
+# serves the parallel agents one after another; a missed deadline leaves that
+# agent's output empty and is recorded in MultiAgentResult.timed_out
+AGENT_TIMEOUTS = {
+    'root_cause': 60,
+    'impact': 45,
+    'actions': 60,
+    'knowledge': 60,
+    'consistency': 30,
+}
+_DEFAULT_AGENT_TIMEOUT = 60
+_TIMEOUT_ERROR = "Timed out"
+
+# Display name (as passed to _run_agent) and empty output per agent key, used when an agent times out
+_AGENT_OUTPUTS = {
+    'root_cause': ('RootCause', RootCauseOutput),
+    'impact': ('Impact', ImpactOutput),
+    'actions': ('Actions', ActionsOutput),
+    'knowledge': ('Knowledge', KnowledgeOutput),
+    'consistency': ('Consistency', ConsistencyOutput),
+}
 
 
 # ---------------------------------------------------------------------------
@@ -506,9 +530,10 @@ def parse_consistency_v2(text: str) -> ConsistencyOutput:
     if m:
         out.quality_assessment = m.group(1).strip()
         # Extract quality level
-        if 'HIGH' in out.quality_assessment.upper():
+        quality = out.quality_assessment.upper()
+        if 'HIGH' in quality:
             out.confidence = 90
-        elif 'MEDIUM' in out.quality_assessment.upper():
+        elif 'MEDIUM' in quality:
             out.confidence = 60
         else:
             out.confidence = 30
@@ -736,6 +761,54 @@ def _run_agent(
         return (name, parser(""), elapsed, str(e))
 
 
+def _collect_agents(futures: Dict[str, Any], progress_cb: Optional[Callable[[str], None]] = None) -> Dict[str, tuple]:
+    """Wait for agent futures, reporting each one from the calling thread as it finishes.
+
+    An agent still running past its AGENT_TIMEOUTS deadline gets an empty output and a
+    "Timed out" error instead of holding up the rest of the analysis.
+    """
+    start = time.time()
+    names = {f: name for name, f in futures.items()}
+    deadlines = {f: start + AGENT_TIMEOUTS.get(name, _DEFAULT_AGENT_TIMEOUT) for f, name in names.items()}
+    results = {}
+    pending = set(names)
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, min(deadlines[f] for f in pending) - time.time()),
+                             return_when=FIRST_COMPLETED)
+        for f in done:
+            results[names[f]] = f.result()
+            if progress_cb:
+                progress_cb(f"🤖 {results[names[f]][0]} agent finished")
+        now = time.time()
+        for f in [f for f in pending if deadlines[f] <= now]:
+            pending.discard(f)
+            f.cancel()
+            key = names[f]
+            limit = AGENT_TIMEOUTS.get(key, _DEFAULT_AGENT_TIMEOUT)
+            name, empty_output = _AGENT_OUTPUTS[key]
+            logger.warning(f"🤖 [{name}] timed out after {limit}s")
+            results[key] = (name, empty_output(), now - start, f"{_TIMEOUT_ERROR} after {limit}s")
+            if progress_cb:
+                progress_cb(f"⏱️ {name} agent timed out")
+    return results
+
+
+def _run_agents(specs: Dict[str, tuple], progress_cb: Optional[Callable[[str], None]] = None) -> Dict[str, tuple]:
+    """Run _run_agent for each spec concurrently and collect them with per-agent deadlines"""
+    pool = ThreadPoolExecutor(max_workers=len(specs))
+    try:
+        futures = {key: pool.submit(_run_agent, *args) for key, args in specs.items()}
+        return _collect_agents(futures, progress_cb)
+    finally:
+        # Don't block on agents that overran; their HTTP calls finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed_out(runs: Dict[str, tuple]) -> List[str]:
+    """Agent keys in a _run_agents result that missed their deadline"""
+    return [key for key, (_, _, _, err) in runs.items() if err and err.startswith(_TIMEOUT_ERROR)]
+
+
 # ---------------------------------------------------------------------------
 # Main Entry Point
 # ---------------------------------------------------------------------------
@@ -794,7 +867,8 @@ def run_multi_agent_v2(
     solutions: list,
     timeline: list,
     llm_callable,
-    kb_search_results: Optional[Dict] = None  # NEW: KB search results
+    kb_search_results: Optional[Dict] = None,  # NEW: KB search results
+    progress_cb: Optional[Callable[[str], None]] = None
 ) -> MultiAgentResult:
     """
     Enhanced multi-agent with Knowledge agent providing company context.
@@ -805,6 +879,9 @@ def run_multi_agent_v2(
     Mode selection:
       - CRITICAL + confidence >= 0.75 → partial_sequential with KB validation
       - Everything else → parallel (all 4 at once)
+
+    progress_cb (optional) receives a short status message as each agent finishes.
+    It is always called from the calling thread, never from a worker.
     """
     start = time.time()
     result = MultiAgentResult()
@@ -837,13 +914,12 @@ def run_multi_agent_v2(
         # --- PARTIAL SEQUENTIAL: All 3 analysis agents + KB in parallel, then validate ---
         logger.info("🤖 Phase 1: Root + Impact + Knowledge (parallel)")
 
-        with ThreadPoolExecutor(max_workers=3) as pool:
-            futures = {
-                'root_cause': pool.submit(_run_agent, 'RootCause', root_prompt, llm_callable, parse_root_cause),
-                'impact':     pool.submit(_run_agent, 'Impact', impact_prompt, llm_callable, parse_impact),
-                'knowledge':  pool.submit(_run_agent, 'Knowledge', knowledge_prompt, llm_callable, parse_knowledge, 600),
-            }
-            phase1 = {name: f.result() for name, f in futures.items()}
+        phase1 = _run_agents({
+            'root_cause': ('RootCause', root_prompt, llm_callable, parse_root_cause),
+            'impact':     ('Impact', impact_prompt, llm_callable, parse_impact),
+            'knowledge':  ('Knowledge', knowledge_prompt, llm_callable, parse_knowledge, 600),
+        }, progress_cb)
+        result.timed_out.extend(_timed_out(phase1))
 
         # Unpack phase 1
         _, result.root_cause, rc_time, rc_err = phase1['root_cause']
@@ -886,9 +962,11 @@ def run_multi_agent_v2(
         # Phase 2: Actions
         logger.info("🤖 Phase 2: Actions (with Phase 1 context)")
         action_prompt = build_actions_prompt(ctx, agent_context=agent_context)
-        _, result.actions, act_time, act_err = _run_agent(
-            'Actions', action_prompt, llm_callable, parse_actions
-        )
+        phase2 = _run_agents({
+            'actions': ('Actions', action_prompt, llm_callable, parse_actions),
+        }, progress_cb)
+        result.timed_out.extend(_timed_out(phase2))
+        _, result.actions, act_time, act_err = phase2['actions']
         result.agent_times['actions'] = act_time
         if act_err:
             result.errors.append(f"Actions: {act_err}")
@@ -897,17 +975,16 @@ def run_multi_agent_v2(
         # --- PARALLEL: all 4 at once ---
         action_prompt = build_actions_prompt(ctx)
 
-        with ThreadPoolExecutor(max_workers=4) as pool:
-            futures = {
-                'root_cause': pool.submit(_run_agent, 'RootCause', root_prompt, llm_callable, parse_root_cause),
-                'impact':     pool.submit(_run_agent, 'Impact', impact_prompt, llm_callable, parse_impact),
-                'actions':    pool.submit(_run_agent, 'Actions', action_prompt, llm_callable, parse_actions),
-                'knowledge':  pool.submit(_run_agent, 'Knowledge', knowledge_prompt, llm_callable, parse_knowledge, 600),
-            }
-            results = {name: f.result() for name, f in futures.items()}
-
-        for agent_name, (_, output, elapsed, err) in results.items():
-            result.agent_times[agent_name] = elapsed
+        results = _run_agents({
+            'root_cause': ('RootCause', root_prompt, llm_callable, parse_root_cause),
+            'impact':     ('Impact', impact_prompt, llm_callable, parse_impact),
+            'actions':    ('Actions', action_prompt, llm_callable, parse_actions),
+            'knowledge':  ('Knowledge', knowledge_prompt, llm_callable, parse_knowledge, 600),
+        }, progress_cb)
+        result.timed_out.extend(_timed_out(results))
+
+        for agent_key, (agent_name, output, elapsed, err) in results.items():
+            result.agent_times[agent_key] = elapsed
             if err:
                 result.errors.append(f"{agent_name}: {err}")
 
@@ -918,12 +995,16 @@ def run_multi_agent_v2(
 
     # --- ENHANCED Consistency check (compares 3 analysis agents only) ---
     logger.info("🤖 Enhanced consistency check: comparing Root Cause, Impact, and Actions agents...")
+    if progress_cb:
+        progress_cb("⚖️ Checking agent consistency...")
     consistency_prompt = build_consistency_prompt_v2(
         result.root_cause, result.impact, result.actions, result.knowledge
     )
-    _, result.consistency, cons_time, cons_err = _run_agent(
-        'Consistency', consistency_prompt, llm_callable, parse_consistency_v2, max_tokens=400
-    )
+    consistency_run = _run_agents({
+        'consistency': ('Consistency', consistency_prompt, llm_callable, parse_consistency_v2, 400),
+    })
+    result.timed_out.extend(_timed_out(consistency_run))
+    _, result.consistency, cons_time, cons_err = consistency_run['consistency']
     result.agent_times['consistency'] = cons_time
     if cons_err:
         result.errors.append(f"Consistency: {cons_err}")
@@ -4,7 +4,7 @@ import requests
 import time
 import logging
 import re
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, Callable
 from dataclasses import dataclass, field
 from enum import Enum
 from dotenv import load_dotenv
@@ -793,22 +793,33 @@ class RAGLogAnalyzer:
                     known_names.add(c.name)
                     if c.escalation_contact and c.escalation_contact != 'CEO':
                         known_names.add(c.escalation_contact)
+        self._known_names = list(known_names)
+
+        self._sanitizers = {}
+        self.sanitizer = self.sanitizer_for(enable_layer2_sanitization)
+
+    def sanitizer_for(self, layer2: bool) -> SanitizationPipeline:
+        """Sanitization pipeline for a Layer 2 setting; built once per setting and never swapped"""
+        pipeline = self._sanitizers.get(layer2)
+        if pipeline is not None:
+            return pipeline
 
         # Layer 2 uses a standalone Ollama client — works even when main backend is Groq/Claude.
         # If Ollama isn't running, Layer 2 degrades silently.
         # NEW: Layer 2 can be disabled via enable_layer2_sanitization flag
         ollama_san_fn = None
-        if backend != BackendType.OLLAMA_LOCAL and enable_layer2_sanitization:
+        if self.backend != BackendType.OLLAMA_LOCAL and layer2:
             ollama_san_fn = create_ollama_sanitizer_callable()
             logger.info("🔒 Layer 2 (LLM) sanitization: ENABLED")
-        elif backend != BackendType.OLLAMA_LOCAL:
+        elif self.backend != BackendType.OLLAMA_LOCAL:
             logger.info("🔒 Layer 2 (LLM) sanitization: DISABLED (user preference)")
 
-        self.sanitizer = SanitizationPipeline(
-            backend_type=backend.value,
-            known_names=list(known_names),
+        # setdefault keeps the first pipeline if two callers race to build the same setting
+        return self._sanitizers.setdefault(layer2, SanitizationPipeline(
+            backend_type=self.backend.value,
+            known_names=self._known_names,
             ollama_callable=ollama_san_fn
-        )
+        ))
 
     def _call_groq_api(self, prompt: str, max_tokens: int = 512, temperature: float = 0.1) -> Optional[str]:
         for attempt in range(3):
@@ -1200,12 +1211,16 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
             logger.error(f"❌ Analysis error: {e}")
             return f"Error: {str(e)}", 0.0, "Analysis failed"
 
-    def analyze(self, log_text: str) -> AnalysisResult:
+    def analyze(self, log_text: str,
+                progress_cb: Optional[Callable[[str], None]] = None,
+                enable_layer2: Optional[bool] = None) -> AnalysisResult:
         """Full analysis pipeline with IMPROVED confidence-based matching"""
         
         start = time.time()
         
         try:
+            if progress_cb:
+                progress_cb("🔍 Reading your log file...")
             # IMPROVED: Extract with confidence
             severity = self.matcher.extract_severity(log_text)
             system, system_confidence, detection_explanation = self.matcher.extract_system_with_confidence(log_text)
@@ -1228,15 +1243,22 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
             contacts, solutions = self.get_contacts_and_solutions(system, issue_type, system_confidence)
             
             # Get related incidents from KB
+            if progress_cb:
+                progress_cb("📚 Searching knowledge base...")
             incidents = self.query_kb_for_incidents(log_text)
             
             # Sanitize before sending to LLM (GDPR — pattern matching already ran on original)
-            sanitization_result = self.sanitizer.sanitize(log_text)
+            if progress_cb:
+                progress_cb("🔒 Sanitizing log...")
+            sanitizer = self.sanitizer if enable_layer2 is None else self.sanitizer_for(enable_layer2)
+            sanitization_result = sanitizer.sanitize(log_text)
             
             # FIXED: Extract timeline from SANITIZED text so LLM doesn't see raw IPs
             timeline = self.matcher.extract_timeline(sanitization_result.sanitized_text)
             
             # Generate analysis (with confidence awareness)
+            if progress_cb:
+                progress_cb("🧠 Analyzing with AI...")
             analysis, base_confidence, base_explanation = self.generate_analysis(
                 sanitization_result.sanitized_text, contacts, solutions, system, severity, system_confidence
             )
@@ -1291,7 +1313,9 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
             )
 
 
-    def analyze_multi(self, log_text: str) -> AnalysisResult:
+    def analyze_multi(self, log_text: str,
+                      progress_cb: Optional[Callable[[str], None]] = None,
+                      enable_layer2: Optional[bool] = None) -> AnalysisResult:
         """
         ENHANCED Multi-agent analysis pipeline with Knowledge Validator.
         
@@ -1307,10 +1331,18 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
         - Quality assessment: HIGH/MEDIUM/LOW based on conflict types
         
         The single-agent analyze() is untouched — both paths coexist.
+
+        progress_cb (optional) receives a short status message as each stage
+        and each agent completes, so the UI can show live progress.
+
+        enable_layer2 (optional) overrides the constructor's Layer 2 setting
+        for this call only; the analyzer itself is never modified.
         """
         start = time.time()
 
         try:
+            if progress_cb:
+                progress_cb("🔍 Reading your log file...")
             # --- Identical to analyze(): pattern matching + lookups ---
             severity = self.matcher.extract_severity(log_text)
             system, system_confidence, detection_explanation = self.matcher.extract_system_with_confidence(log_text)
@@ -1326,11 +1358,16 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
             logger.info(f"   System Confidence: {system_confidence:.0%} - {detection_explanation}")
 
             contacts, solutions = self.get_contacts_and_solutions(system, issue_type, system_confidence)
+            if progress_cb:
+                progress_cb("📚 Searching knowledge base...")
             incidents = self.query_kb_for_incidents(log_text)
 
             # Sanitize before sending to cloud LLM (GDPR)
             # Pattern matching already ran on original — that's all local.
-            sanitization_result = self.sanitizer.sanitize(log_text)
+            if progress_cb:
+                progress_cb("🔒 Sanitizing log...")
+            sanitizer = self.sanitizer if enable_layer2 is None else self.sanitizer_for(enable_layer2)
+            sanitization_result = sanitizer.sanitize(log_text)
             
             # FIXED: Extract timeline from SANITIZED text so agents don't see raw IPs
             timeline = self.matcher.extract_timeline(sanitization_result.sanitized_text)
@@ -1366,6 +1403,8 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
 
             # --- Multi-agent replaces generate_analysis() from here ---
             # ENHANCED: Now includes kb_search_results for Knowledge validator agent
+            if progress_cb:
+                progress_cb("🧠 Running analysis agents...")
             multi_result = run_multi_agent(
                 log_text=sanitization_result.sanitized_text,
                 system=system,
@@ -1376,7 +1415,8 @@ CRITICAL: Do NOT just repeat log timestamps or lines. ANALYZE and EXPLAIN what t
                 solutions=solutions,
                 timeline=timeline,
                 llm_callable=self._call_llm,
-                kb_search_results=kb_search_results  # ENHANCED: KB data for validation
+                kb_search_results=kb_search_results,  # ENHANCED: KB data for validation
+                progress_cb=progress_cb
             )
 
             # Build a combined analysis string for backward compat
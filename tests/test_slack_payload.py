@@ -0,0 +1,29 @@
+"""Copy-for-Slack payload must not be able to break out of its <script> tag"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+PAYLOAD = 'Root cause: </script><script>alert(1)</script> <!-- & more'
+
+
+def test_script_json_has_no_markup():
+    encoded = app.script_json(PAYLOAD)
+    for token in ('<', '>', '&'):
+        assert token not in encoded
+
+
+def test_script_json_round_trips():
+    assert json.loads(app.script_json(PAYLOAD)) == PAYLOAD
+
+
+def test_clipboard_script_keeps_one_script_tag():
+    script = app._CLIPBOARD_SCRIPT.replace("{SLACK_JSON}", app.script_json(PAYLOAD))
+    assert script.count('<script>') == 1
+    assert script.count('</script>') == 1
+    assert script.endswith('</script>')